@@ -0,0 +1,9 @@
+"""Gunicorn settings for the web service, loaded from the backend directory."""
+
+import os
+
+bind = "0.0.0.0:8000"
+# Threaded workers so each process has several requests in flight; the
+# admission limiter in leads.admission is sized from the same value.
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "32"))
@@ -0,0 +1,336 @@
+"""
+Queue-lag driven pool autoscaler for the leads worker.
+
+Celery's stock autoscaler only counts reserved tasks, which with a prefetch
+multiplier of 1 barely moves before the backlog is already large. This one
+sizes the pool from broker queue depth, the age of the oldest waiting
+message and the observed duration of each leads task type, with separate
+cooldowns for growing and shrinking. Broker sampling runs on a background
+thread so the worker event loop never blocks on it.
+
+Enable with ``celery -A high_traffic worker --autoscale=MAX,MIN``.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import math
+import threading
+from collections import Counter
+from time import monotonic, time
+from typing import Any, Dict, List, Optional
+
+from celery.worker.autoscale import Autoscaler
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+ENQUEUED_AT_HEADER = "enqueued_at"
+DURATION_CACHE_KEY = "autoscale:duration:{task}:{bucket}:{field}"
+DECISION_CACHE_KEY = "autoscale:decision:{hostname}"
+
+_pending_durations: Dict[str, List[float]] = {}
+_pending_lock = threading.Lock()
+_last_publish = 0.0
+
+
+def record_task_duration(task_name: str, duration: float) -> None:
+    """
+    Add one task runtime to this process's totals, publishing them at most
+    every ``AUTOSCALE_DURATION_PUBLISH_INTERVAL`` seconds.
+    """
+    global _last_publish
+    with _pending_lock:
+        totals = _pending_durations.setdefault(task_name, [0.0, 0])
+        totals[0] += duration
+        totals[1] += 1
+        now = monotonic()
+        if now - _last_publish < settings.AUTOSCALE_DURATION_PUBLISH_INTERVAL:
+            return
+        _last_publish = now
+        pending = dict(_pending_durations)
+        _pending_durations.clear()
+    publish_task_durations(pending)
+
+
+def publish_task_durations(pending: Dict[str, List[float]]) -> None:
+    """
+    Add per-task runtime totals to the current time bucket in the cache.
+
+    Totals are integer increments, so concurrent workers never overwrite
+    each other; on a cache error they are kept for the next publish.
+    """
+    window = settings.AUTOSCALE_DURATION_WINDOW
+    bucket = int(time() // window)
+    for task_name, (total, count) in pending.items():
+        try:
+            for field, delta in (("us", round(total * 1_000_000)), ("n", count)):
+                key = DURATION_CACHE_KEY.format(task=task_name, bucket=bucket, field=field)
+                cache.add(key, 0, timeout=window * 3)
+                cache.incr(key, delta)
+        except Exception as exc:  # cache outage must not fail tasks
+            logger.debug("Unable to publish task durations: %s", exc)
+            with _pending_lock:
+                totals = _pending_durations.setdefault(task_name, [0.0, 0])
+                totals[0] += total
+                totals[1] += count
+
+
+def task_duration(task_name: str, default: float) -> float:
+    """Mean runtime over the current and previous buckets, or ``default``."""
+    bucket = int(time() // settings.AUTOSCALE_DURATION_WINDOW)
+    keys = [
+        DURATION_CACHE_KEY.format(task=task_name, bucket=b, field=field)
+        for b in (bucket - 1, bucket)
+        for field in ("us", "n")
+    ]
+    try:
+        values = cache.get_many(keys)
+    except Exception:  # pragma: no cover - cache outage
+        return default
+    total = sum(values.get(key, 0) for key in keys[0::2])
+    count = sum(values.get(key, 0) for key in keys[1::2])
+    return total / 1_000_000 / count if count else default
+
+
+class BrokerSampler(threading.Thread):
+    """
+    Poll the broker from a background thread and keep the latest numbers.
+
+    One connection is reused between samples and every broker call is bounded
+    by ``timeout``; on error the connection is dropped and reopened on the
+    next tick. Without a ``default_task`` only depth is sampled and the
+    backlog is not weighted by task duration.
+    """
+
+    def __init__(
+        self,
+        app,
+        *,
+        queues: List[str],
+        interval: float,
+        timeout: float,
+        age_queues: Optional[List[str]] = None,
+        mix_sample: int = 0,
+        default_task: Optional[str] = None,
+        default_duration: float = 0.0,
+        name: str = "autoscale-sampler",
+    ) -> None:
+        super().__init__(name=name, daemon=True)
+        self.app = app
+        self.queues = queues
+        self.age_queues = set(age_queues or [])
+        self.interval = interval
+        self.timeout = timeout
+        self.mix_sample = mix_sample
+        self.default_task = default_task
+        self.default_duration = default_duration
+        self.latest: Optional[Dict[str, Any]] = None
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        conn = None
+        while not self._stopped.is_set():
+            try:
+                if conn is None:
+                    conn = self.app.connection_for_read(
+                        connect_timeout=self.timeout,
+                        transport_options={
+                            "socket_timeout": self.timeout,
+                            "socket_connect_timeout": self.timeout,
+                        },
+                    )
+                self.latest = self.sample(conn.default_channel)
+            except Exception as exc:
+                logger.warning("%s could not inspect the broker: %s", self.name, exc)
+                if conn is not None:
+                    conn.release()
+                    conn = None
+            self._stopped.wait(self.interval)
+        if conn is not None:
+            conn.release()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def sample(self, channel) -> Dict[str, Any]:
+        """
+        Return queue depth, oldest message age (priority queues only) and the
+        backlog in seconds of work, weighting each queue by the task mix seen
+        in its next ``mix_sample`` messages.
+        """
+        depth = 0
+        oldest: Optional[float] = None
+        backlog = 0.0
+        mix: Counter = Counter()
+        now = time()
+        redis_client = getattr(channel, "client", None)
+
+        for queue in self.queues:
+            queue_depth = channel.queue_declare(queue=queue, passive=True).message_count
+            depth += queue_depth
+            if not queue_depth:
+                continue
+
+            # The Redis transport pushes on the left and pops on the right,
+            # so the tail of the list holds the next (oldest) messages.
+            headers = []
+            if redis_client is not None and self.mix_sample:
+                headers = [
+                    _message_headers(raw)
+                    for raw in redis_client.lrange(queue, -self.mix_sample, -1)
+                ]
+
+            if queue in self.age_queues and headers:
+                enqueued_at = headers[-1].get(ENQUEUED_AT_HEADER)
+                if enqueued_at:
+                    age = max(0.0, now - float(enqueued_at))
+                    oldest = age if oldest is None else max(oldest, age)
+
+            if not self.default_task:
+                continue
+            queue_mix = Counter(item.get("task") or self.default_task for item in headers)
+            if not queue_mix:
+                queue_mix[self.default_task] = 1
+            sampled = sum(queue_mix.values())
+            per_message = sum(
+                count * task_duration(task, self.default_duration)
+                for task, count in queue_mix.items()
+            ) / sampled
+            backlog += queue_depth * per_message
+            mix.update(queue_mix)
+
+        return {
+            "queue_depth": depth,
+            "oldest_age": oldest,
+            "backlog_seconds": backlog,
+            "task_mix": dict(mix),
+            "sampled_at": monotonic(),
+        }
+
+
+def _message_headers(raw: Any) -> Dict[str, Any]:
+    try:
+        headers = json.loads(raw)["headers"]
+    except (ValueError, KeyError, TypeError):
+        return {}
+    return headers if isinstance(headers, dict) else {}
+
+
+class QueueLagAutoscaler(Autoscaler):
+    """Size the pool so the current backlog drains within the target lag."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.queues = list(settings.AUTOSCALE_QUEUES)
+        self.target_lag = settings.AUTOSCALE_TARGET_LAG
+        self.sample_interval = settings.AUTOSCALE_SAMPLE_INTERVAL
+        self.up_cooldown = settings.AUTOSCALE_UP_COOLDOWN
+        self.down_cooldown = settings.AUTOSCALE_DOWN_COOLDOWN
+        self.down_step = settings.AUTOSCALE_DOWN_STEP
+
+        self._last_change = 0.0
+        self.last_decision: Dict[str, Any] = {}
+        self.sampler: Optional[BrokerSampler] = None
+
+    def _start_sampler(self) -> BrokerSampler:
+        sampler = BrokerSampler(
+            self.worker.app,
+            queues=self.queues,
+            # Low-priority traffic is expected to wait, so its age must not
+            # trigger the lateness boost.
+            age_queues=[
+                queue for queue in self.queues if queue != settings.HEAVY_HITTER_LOW_PRIORITY_QUEUE
+            ],
+            interval=self.sample_interval,
+            timeout=settings.AUTOSCALE_BROKER_TIMEOUT,
+            mix_sample=settings.AUTOSCALE_MIX_SAMPLE,
+            default_task=settings.AUTOSCALE_DURATION_TASKS[0],
+            default_duration=settings.AUTOSCALE_DEFAULT_DURATION,
+        )
+        sampler.start()
+        return sampler
+
+    def desired_processes(self, backlog_seconds: float, oldest: Optional[float]) -> int:
+        """
+        Processes needed to finish ``backlog_seconds`` of queued work within the
+        target lag (Little's law), boosted proportionally when the oldest
+        priority message is already late.
+        """
+        needed = math.ceil(backlog_seconds / self.target_lag) if backlog_seconds > 0 else 0
+        if oldest is not None and oldest > self.target_lag:
+            needed = max(needed, math.ceil(self.processes * oldest / self.target_lag))
+        needed = max(needed, self.qty)
+        return max(self.min_concurrency, min(self.max_concurrency, needed))
+
+    # ------------------------------------------------------------------
+    # Celery hooks
+    # ------------------------------------------------------------------
+    def _maybe_scale(self, req=None):
+        # Runs on the worker event loop: only read the sampler's cached numbers.
+        if self.sampler is None:
+            self.sampler = self._start_sampler()
+
+        now = monotonic()
+        stats = self.sampler.latest
+        max_age = 3 * self.sample_interval + settings.AUTOSCALE_BROKER_TIMEOUT
+        if stats is None or now - stats["sampled_at"] > max_age:
+            return super()._maybe_scale(req)
+        if self.last_decision.get("sampled_at") == stats["sampled_at"]:
+            return None
+
+        procs = self.processes
+        desired = self.desired_processes(stats["backlog_seconds"], stats["oldest_age"])
+        since_change = now - self._last_change
+
+        action = "hold"
+        if desired > procs and since_change >= self.up_cooldown:
+            self.scale_up(desired - procs)
+            action = "up"
+        elif desired < procs and since_change >= self.down_cooldown:
+            self._shrink(min(self.down_step, procs - desired))
+            action = "down"
+
+        if action != "hold":
+            self._last_change = now
+
+        oldest = stats["oldest_age"]
+        self._export(
+            {
+                "action": action,
+                "current": procs,
+                "desired": desired,
+                "queue_depth": stats["queue_depth"],
+                "oldest_age": round(oldest, 3) if oldest is not None else None,
+                "backlog_seconds": round(stats["backlog_seconds"], 3),
+                "task_mix": stats["task_mix"],
+                "reserved": self.qty,
+                "sampled_at": stats["sampled_at"],
+                "timestamp": time(),
+            }
+        )
+        return action != "hold"
+
+    def _export(self, decision: Dict[str, Any]) -> None:
+        self.last_decision = decision
+        if decision["action"] != "hold":
+            logger.info("Autoscaler decision: %s", json.dumps(decision))
+        hostname = getattr(self.worker, "hostname", "worker")
+        try:
+            cache.set(DECISION_CACHE_KEY.format(hostname=hostname), decision, timeout=300)
+        except Exception:  # pragma: no cover - cache outage
+            pass
+
+    def stop(self):
+        if self.sampler is not None:
+            self.sampler.stop()
+        super().stop()
+
+    def info(self):
+        return {
+            **super().info(),
+            "target_lag": self.target_lag,
+            "last_decision": self.last_decision,
+        }
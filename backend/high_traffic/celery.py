@@ -1,13 +1,45 @@
 import os
+from time import monotonic, time
 
 from celery import Celery
+from celery.signals import before_task_publish, task_postrun, task_prerun
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "high_traffic.settings")
 
 app = Celery("high_traffic")
 app.config_from_object("django.conf:settings", namespace="CELERY")
+app.conf.worker_autoscaler = "high_traffic.autoscale:QueueLagAutoscaler"
 app.autodiscover_tasks()
 
+_task_started: dict[str, float] = {}
+
+
+@before_task_publish.connect
+def stamp_enqueue_time(headers=None, **kwargs):
+    """Record when a message was published so the autoscaler can measure lag."""
+    if headers is not None:
+        headers.setdefault("enqueued_at", time())
+
+
+@task_prerun.connect
+def start_task_timer(task_id=None, task=None, **kwargs):
+    """Time the tasks the autoscaler sizes the pool by."""
+    from django.conf import settings
+
+    if task is not None and task.name in settings.AUTOSCALE_DURATION_TASKS:
+        _task_started[task_id] = monotonic()
+
+
+@task_postrun.connect
+def record_task_timer(task_id=None, task=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is None:
+        return
+
+    from .autoscale import record_task_duration
+
+    record_task_duration(task.name, monotonic() - started)
+
 
 @app.task(bind=True)
 def ping(self):
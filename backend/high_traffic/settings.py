@@ -55,6 +55,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "leads.middleware.TrafficCaptureMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -192,7 +193,54 @@ CELERY_TASK_DEFAULT_QUEUE = "leads"
 CELERY_TASK_ACKS_LATE = True
 CELERY_WORKER_PREFETCH_MULTIPLIER = 1
 CELERY_WORKER_MAX_TASKS_PER_CHILD = 1000
+# Drain queues in the order the worker lists them (leads before leads_low).
+CELERY_BROKER_TRANSPORT_OPTIONS = {"queue_order_strategy": "priority"}
+
+# Queue-lag autoscaler (high_traffic.autoscale), active with --autoscale=MAX,MIN.
+AUTOSCALE_QUEUES = [
+    queue.strip()
+    for queue in os.environ.get("AUTOSCALE_QUEUES", "leads,leads_low").split(",")
+    if queue.strip()
+]
+AUTOSCALE_TARGET_LAG = float(os.environ.get("AUTOSCALE_TARGET_LAG", "10"))
+AUTOSCALE_SAMPLE_INTERVAL = float(os.environ.get("AUTOSCALE_SAMPLE_INTERVAL", "2"))
+AUTOSCALE_UP_COOLDOWN = float(os.environ.get("AUTOSCALE_UP_COOLDOWN", "5"))
+AUTOSCALE_DOWN_COOLDOWN = float(os.environ.get("AUTOSCALE_DOWN_COOLDOWN", "60"))
+AUTOSCALE_DOWN_STEP = int(os.environ.get("AUTOSCALE_DOWN_STEP", "1"))
+AUTOSCALE_BROKER_TIMEOUT = float(os.environ.get("AUTOSCALE_BROKER_TIMEOUT", "1"))
+# Tasks whose runtimes are tracked; the first is assumed for unlabelled messages.
+AUTOSCALE_DURATION_TASKS = [
+    "leads.tasks.process_lead_submission",
+    "leads.tasks.process_lead_batch",
+    "leads.tasks.deliver_lead_outbox",
+]
+AUTOSCALE_MIX_SAMPLE = int(os.environ.get("AUTOSCALE_MIX_SAMPLE", "50"))
+# Workers publish runtime totals into buckets of this many seconds.
+AUTOSCALE_DURATION_WINDOW = int(os.environ.get("AUTOSCALE_DURATION_WINDOW", "60"))
+AUTOSCALE_DURATION_PUBLISH_INTERVAL = float(os.environ.get("AUTOSCALE_DURATION_PUBLISH_INTERVAL", "5"))
+AUTOSCALE_DEFAULT_DURATION = float(os.environ.get("AUTOSCALE_DEFAULT_DURATION", "0.2"))
+
 
+# ------------------------------------------------------------------------------
+# CRM webhook delivery (transactional outbox)
+# ------------------------------------------------------------------------------
+CRM_WEBHOOK_URL = os.environ.get("CRM_WEBHOOK_URL", "")
+CRM_WEBHOOK_TOKEN = os.environ.get("CRM_WEBHOOK_TOKEN", "")
+CRM_WEBHOOK_BATCH_SIZE = int(os.environ.get("CRM_WEBHOOK_BATCH_SIZE", "200"))
+CRM_WEBHOOK_BATCH_WINDOW = int(os.environ.get("CRM_WEBHOOK_BATCH_WINDOW", "2"))
+CRM_WEBHOOK_CONCURRENCY = int(os.environ.get("CRM_WEBHOOK_CONCURRENCY", "4"))
+CRM_WEBHOOK_CONNECT_TIMEOUT = float(os.environ.get("CRM_WEBHOOK_CONNECT_TIMEOUT", "3"))
+CRM_WEBHOOK_READ_TIMEOUT = float(os.environ.get("CRM_WEBHOOK_READ_TIMEOUT", "10"))
+CRM_WEBHOOK_MAX_ATTEMPTS = int(os.environ.get("CRM_WEBHOOK_MAX_ATTEMPTS", "8"))
+CRM_WEBHOOK_RETRY_BACKOFF = int(os.environ.get("CRM_WEBHOOK_RETRY_BACKOFF", "5"))
+
+# Safety net for retries and for kicks lost while the broker was down.
+CELERY_BEAT_SCHEDULE = {
+    "deliver-lead-outbox": {
+        "task": "leads.tasks.deliver_lead_outbox",
+        "schedule": float(os.environ.get("CRM_WEBHOOK_SWEEP_INTERVAL", "10")),
+    },
+}
 
 # ------------------------------------------------------------------------------
 # Mongo logging
@@ -206,10 +254,66 @@ MONGO_DB_NAME = os.environ.get("MONGO_DB_NAME", "landing_logs")
 # ------------------------------------------------------------------------------
 RATELIMIT_ENABLE = bool(REDIS_URL)
 RATELIMIT_USE_CACHE = "default"
+# django_ratelimit keys on REMOTE_ADDR by default. Replay and load-test
+# environments set this to key on the first X-Forwarded-For entry instead;
+# never enable it where clients can reach the app without a trusted proxy.
+if os.environ.get("RATELIMIT_TRUST_X_FORWARDED_FOR", "false").lower() in {"1", "true", "yes"}:
+    RATELIMIT_IP_META_KEY = "leads.utils.get_client_ip"
 # Only load django_ratelimit when a shared cache (e.g., Redis) is configured
 if RATELIMIT_ENABLE:
     INSTALLED_APPS.append("django_ratelimit")
 
+# Heavy-hitter detection: shed hot user agents (per /24 network) and phone
+# prefixes that rotate around the per-IP rate limit, which already covers
+# single addresses. Thresholds are submissions per window across all processes.
+HEAVY_HITTER_ENABLE = os.environ.get("HEAVY_HITTER_ENABLE", "true").lower() in {"1", "true", "yes"}
+HEAVY_HITTER_ACTION = os.environ.get("HEAVY_HITTER_ACTION", "deprioritise")  # or "reject"
+HEAVY_HITTER_WINDOW_SECONDS = int(os.environ.get("HEAVY_HITTER_WINDOW_SECONDS", "60"))
+HEAVY_HITTER_TOP_K = int(os.environ.get("HEAVY_HITTER_TOP_K", "50"))
+HEAVY_HITTER_FLUSH_INTERVAL = float(os.environ.get("HEAVY_HITTER_FLUSH_INTERVAL", "2"))
+HEAVY_HITTER_PHONE_PREFIX_LENGTH = int(os.environ.get("HEAVY_HITTER_PHONE_PREFIX_LENGTH", "7"))
+HEAVY_HITTER_THRESHOLDS = {
+    "user_agent": int(os.environ.get("HEAVY_HITTER_USER_AGENT_THRESHOLD", "300")),
+    "phone_prefix": int(os.environ.get("HEAVY_HITTER_PHONE_PREFIX_THRESHOLD", "300")),
+}
+HEAVY_HITTER_LOW_PRIORITY_QUEUE = os.environ.get("HEAVY_HITTER_LOW_PRIORITY_QUEUE", "leads_low")
+
+# Partner bulk ingestion: comma-separated "name:key" pairs authorised to call
+# /api/leads/bulk/ with a Bearer or X-API-Key header.
+PARTNER_API_KEYS = dict(
+    entry.strip().split(":", 1)
+    for entry in os.environ.get("PARTNER_API_KEYS", "").split(",")
+    if ":" in entry
+)
+BULK_LEADS_MAX_ROWS = int(os.environ.get("BULK_LEADS_MAX_ROWS", "10000"))
+BULK_LEADS_CHUNK_SIZE = int(os.environ.get("BULK_LEADS_CHUNK_SIZE", "500"))
+BULK_LEADS_MAX_BYTES = int(os.environ.get("BULK_LEADS_MAX_BYTES", str(1024 * 1024)))
+BULK_LEADS_RETRY_AFTER = int(os.environ.get("BULK_LEADS_RETRY_AFTER", "30"))
+
+# Adaptive admission control around the enqueue step (leads.admission):
+# AIMD concurrency limit per process plus a broker-backlog cutoff (0 disables).
+ADMISSION_ENABLE = os.environ.get("ADMISSION_ENABLE", "true").lower() in {"1", "true", "yes"}
+# The limit is per gunicorn process, so it is bounded by its thread count.
+GUNICORN_THREADS = int(os.environ.get("GUNICORN_THREADS", "32"))
+ADMISSION_INITIAL_LIMIT = int(os.environ.get("ADMISSION_INITIAL_LIMIT", str(max(1, GUNICORN_THREADS // 2))))
+ADMISSION_MIN_LIMIT = int(os.environ.get("ADMISSION_MIN_LIMIT", "1"))
+ADMISSION_MAX_LIMIT = int(os.environ.get("ADMISSION_MAX_LIMIT", str(GUNICORN_THREADS)))
+ADMISSION_TARGET_LATENCY = float(os.environ.get("ADMISSION_TARGET_LATENCY", "0.05"))
+ADMISSION_BACKOFF = float(os.environ.get("ADMISSION_BACKOFF", "0.9"))
+ADMISSION_MAX_QUEUE_DEPTH = int(os.environ.get("ADMISSION_MAX_QUEUE_DEPTH", "50000"))
+ADMISSION_QUEUES = [
+    queue.strip()
+    for queue in os.environ.get("ADMISSION_QUEUES", "leads").split(",")
+    if queue.strip()
+]
+ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", "2"))
+
+# Traffic capture for offline replay (leads.middleware). Disabled unless a
+# JSONL output path is given; phone numbers and client IPs are anonymised.
+TRAFFIC_CAPTURE_PATH = os.environ.get("TRAFFIC_CAPTURE_PATH", "")
+TRAFFIC_CAPTURE_SALT = os.environ.get("TRAFFIC_CAPTURE_SALT", "")
+TRAFFIC_CAPTURE_PATHS = ["/", "/api/leads/"]
+
 SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
 X_FRAME_OPTIONS = "DENY"
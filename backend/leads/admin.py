@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Lead
+from .models import Lead, LeadOutbox
 
 
 @admin.register(Lead)
@@ -9,3 +9,12 @@ class LeadAdmin(admin.ModelAdmin):
     list_filter = ("status", "created_at")
     search_fields = ("phone_number",)
     ordering = ("-created_at",)
+
+
+@admin.register(LeadOutbox)
+class LeadOutboxAdmin(admin.ModelAdmin):
+    list_display = ("lead", "status", "attempts", "next_attempt_at", "delivered_at")
+    list_filter = ("status",)
+    search_fields = ("lead__phone_number", "batch_key")
+    raw_id_fields = ("lead",)
+    ordering = ("-created_at",)
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import logging
+import threading
+from functools import lru_cache
+from time import monotonic
+from typing import Any, Dict, List, Optional
+
+from celery import current_app as celery_app
+from django.conf import settings
+
+from high_traffic.autoscale import BrokerSampler
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit around the enqueue step.
+
+    Every fast, successful ``delay()`` grows the limit by ``1 / limit`` (about
+    one slot per round of requests); a slow or failed one shrinks it by
+    ``backoff``, at most once per round: requests that started before the
+    last decrease do not shrink it again. Requests over the limit, or arriving
+    while the broker backlog is above ``max_queue_depth``, are refused instead
+    of queueing threads. The backlog is sampled by a background
+    ``BrokerSampler`` so request threads never wait on the broker.
+    """
+
+    def __init__(
+        self,
+        *,
+        initial_limit: float = 20,
+        min_limit: float = 1,
+        max_limit: float = 200,
+        target_latency: float = 0.05,
+        backoff: float = 0.9,
+        max_queue_depth: int = 0,
+        queues: Optional[List[str]] = None,
+        queue_sample_interval: float = 1.0,
+        broker_timeout: float = 0.5,
+    ) -> None:
+        self.limit = float(initial_limit)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.max_queue_depth = max_queue_depth
+        self.queues = queues or ["leads"]
+        self.queue_sample_interval = queue_sample_interval
+        self.broker_timeout = broker_timeout
+
+        self.inflight = 0
+        self.rejected = 0
+        self.last_latency: Optional[float] = None
+        self.sampler: Optional[BrokerSampler] = None
+
+        self._lock = threading.Lock()
+        self._sampler_lock = threading.Lock()
+        self._last_decrease = float("-inf")
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.inflight >= int(self.limit):
+                self.rejected += 1
+                return False
+            self.inflight += 1
+            return True
+
+    def release(self, latency: float, ok: bool) -> None:
+        now = monotonic()
+        with self._lock:
+            self.inflight -= 1
+            self.last_latency = latency
+            if ok and latency <= self.target_latency:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            elif now - latency >= self._last_decrease:
+                # Calls already in flight at the last decrease saw the same
+                # spike; backing off for each of them would collapse the limit.
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+
+    def broker_backlogged(self) -> bool:
+        """Report whether the sampled broker backlog exceeds ``max_queue_depth``."""
+        if not self.max_queue_depth:
+            return False
+
+        depth = self.queue_depth
+        if depth is not None and depth > self.max_queue_depth:
+            with self._lock:
+                self.rejected += 1
+            return True
+        return False
+
+    @property
+    def queue_depth(self) -> Optional[int]:
+        """Latest sampled backlog, or ``None`` when it is unknown or stale."""
+        if not self.max_queue_depth:
+            return None
+        if self.sampler is None:
+            with self._sampler_lock:
+                if self.sampler is None:
+                    self.sampler = self._start_sampler()
+        stats = self.sampler.latest
+        max_age = 3 * self.queue_sample_interval + self.broker_timeout
+        if stats is None or monotonic() - stats["sampled_at"] > max_age:
+            return None
+        return stats["queue_depth"]
+
+    def _start_sampler(self) -> BrokerSampler:
+        sampler = BrokerSampler(
+            celery_app,
+            queues=self.queues,
+            interval=self.queue_sample_interval,
+            timeout=self.broker_timeout,
+            name="admission-sampler",
+        )
+        sampler.start()
+        return sampler
+
+    def snapshot(self) -> Dict[str, Any]:
+        queue_depth = self.queue_depth
+        with self._lock:
+            return {
+                "limit": int(self.limit),
+                "inflight": self.inflight,
+                "rejected": self.rejected,
+                "last_latency": round(self.last_latency, 4) if self.last_latency is not None else None,
+                "queue_depth": queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+            }
+
+
+@lru_cache
+def get_limiter() -> AdaptiveLimiter:
+    """Return the process-wide enqueue limiter."""
+    return AdaptiveLimiter(
+        initial_limit=settings.ADMISSION_INITIAL_LIMIT,
+        min_limit=settings.ADMISSION_MIN_LIMIT,
+        max_limit=settings.ADMISSION_MAX_LIMIT,
+        target_latency=settings.ADMISSION_TARGET_LATENCY,
+        backoff=settings.ADMISSION_BACKOFF,
+        max_queue_depth=settings.ADMISSION_MAX_QUEUE_DEPTH,
+        queues=settings.ADMISSION_QUEUES,
+    )
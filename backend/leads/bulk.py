@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import codecs
+import json
+import re
+from typing import Any, BinaryIO, Dict, Iterator, List, Tuple
+
+from django.core.exceptions import ValidationError
+
+from .validators import validate_phone_number
+
+NDJSON_CONTENT_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonlines"}
+
+_WHITESPACE = re.compile(r"\s*")
+
+# A phone element is under 40 bytes; anything far larger is rejected before it
+# can be buffered or repeatedly re-decoded.
+MAX_ELEMENT_BYTES = 1024
+
+
+class BulkParseError(ValueError):
+    """Raised when a bulk payload cannot be parsed as a whole."""
+
+
+class BulkLimitError(BulkParseError):
+    """Raised when a bulk payload has more rows than allowed."""
+
+
+def iter_ndjson(stream: BinaryIO) -> Iterator[Tuple[Any, str | None]]:
+    """Yield ``(value, error)`` per non-blank line; bad lines do not abort the batch."""
+    while True:
+        raw_line = stream.readline(MAX_ELEMENT_BYTES + 1)
+        if not raw_line:
+            return
+        if len(raw_line) > MAX_ELEMENT_BYTES:
+            raise BulkParseError(f"NDJSON line longer than {MAX_ELEMENT_BYTES} bytes.")
+        line = raw_line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line), None
+        except ValueError:
+            yield None, "Invalid JSON."
+
+
+def iter_json_array(stream: BinaryIO, chunk_size: int = 64 * 1024) -> Iterator[Tuple[Any, str | None]]:
+    """Incrementally decode the elements of a top-level JSON array."""
+    decoder = json.JSONDecoder()
+    reader = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    pos = 0
+    eof = False
+    state = "start"
+
+    def read_more() -> None:
+        nonlocal buffer, pos, eof
+        if eof:
+            raise BulkParseError("Unexpected end of JSON array.")
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        try:
+            buffer = buffer[pos:] + reader.decode(chunk or b"", final=eof)
+        except UnicodeDecodeError as exc:
+            raise BulkParseError("Payload is not valid UTF-8.") from exc
+        pos = 0
+
+    while True:
+        pos = _WHITESPACE.match(buffer, pos).end()
+        if pos >= len(buffer):
+            read_more()
+            continue
+
+        char = buffer[pos]
+        if state == "start":
+            if char != "[":
+                raise BulkParseError("Expected a JSON array.")
+            pos += 1
+            state = "first"
+        elif char == "]" and state in {"first", "separator"}:
+            pos += 1
+            break
+        elif state == "separator":
+            if char != ",":
+                raise BulkParseError("Expected ',' between array elements.")
+            pos += 1
+            state = "value"
+        else:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as exc:
+                # The element may be cut at a chunk boundary; read once more
+                # unless enough is buffered to know it is invalid or oversized.
+                if eof or len(buffer) - pos > MAX_ELEMENT_BYTES:
+                    raise BulkParseError(f"Invalid JSON array element: {exc.msg}.") from exc
+                read_more()
+                continue
+            if end - pos > MAX_ELEMENT_BYTES:
+                raise BulkParseError(f"Array element longer than {MAX_ELEMENT_BYTES} bytes.")
+            if end == len(buffer) and not eof:
+                # A bare number could still continue in the next chunk.
+                read_more()
+                continue
+            yield value, None
+            pos = end
+            state = "separator"
+
+    while True:
+        pos = _WHITESPACE.match(buffer, pos).end()
+        if pos < len(buffer):
+            raise BulkParseError("Unexpected data after JSON array.")
+        if eof:
+            return
+        read_more()
+
+
+def extract_phone(value: Any) -> str:
+    """Accept either a bare phone string or an object with a ``phone`` field."""
+    if isinstance(value, dict):
+        value = value.get("phone")
+    return value.strip() if isinstance(value, str) else ""
+
+
+def validate_rows(
+    rows: Iterator[Tuple[Any, str | None]],
+    *,
+    max_rows: int,
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Validate every row in a single pass.
+
+    Returns the per-row results and the de-duplicated list of valid numbers, in
+    submission order. Raises ``BulkLimitError`` once ``max_rows`` is exceeded.
+    """
+    results: List[Dict[str, Any]] = []
+    valid: List[str] = []
+    seen: set[str] = set()
+
+    for index, (value, error) in enumerate(rows):
+        if index >= max_rows:
+            raise BulkLimitError(f"Too many rows; the limit is {max_rows}.")
+
+        phone_number = "" if error else extract_phone(value)
+        row: Dict[str, Any] = {"row": index, "phone": phone_number}
+
+        if not error:
+            try:
+                validate_phone_number(phone_number)
+            except ValidationError as exc:
+                error = exc.messages[0]
+
+        if error:
+            row.update(status="invalid", error=error)
+        elif phone_number in seen:
+            row.update(status="duplicate", error="Repeated earlier in this request.")
+        else:
+            seen.add(phone_number)
+            valid.append(phone_number)
+            row["status"] = "queued"
+        results.append(row)
+
+    return results, valid
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import json
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List
+
+import urllib3
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Lead, LeadOutbox
+
+logger = logging.getLogger(__name__)
+
+KICK_CACHE_KEY = "lead_outbox_kick"
+
+
+def is_enabled() -> bool:
+    return bool(getattr(settings, "CRM_WEBHOOK_URL", ""))
+
+
+@lru_cache
+def get_http_pool() -> urllib3.PoolManager:
+    """Return a cached keep-alive connection pool for webhook calls."""
+    return urllib3.PoolManager(
+        maxsize=settings.CRM_WEBHOOK_CONCURRENCY,
+        block=True,
+        timeout=urllib3.Timeout(
+            connect=settings.CRM_WEBHOOK_CONNECT_TIMEOUT,
+            read=settings.CRM_WEBHOOK_READ_TIMEOUT,
+        ),
+        retries=False,
+        headers={"Content-Type": "application/json"},
+    )
+
+
+def enqueue_leads(leads: Iterable[Lead]) -> None:
+    """
+    Add leads to the outbox inside the caller's transaction and schedule a
+    delivery run once it commits.
+    """
+    if not is_enabled():
+        return
+    entries = [LeadOutbox(lead=lead) for lead in leads]
+    if not entries:
+        return
+    LeadOutbox.objects.bulk_create(entries)
+    transaction.on_commit(schedule_delivery)
+
+
+def schedule_delivery() -> None:
+    """Kick a delivery run after the batch window, at most once per window."""
+    from .tasks import deliver_lead_outbox
+
+    window = settings.CRM_WEBHOOK_BATCH_WINDOW
+    try:
+        if not cache.add(KICK_CACHE_KEY, "1", timeout=window):
+            return
+        deliver_lead_outbox.apply_async(countdown=window)
+    except Exception as exc:  # Broker or cache unavailable; the beat run picks it up
+        logger.warning("Failed to schedule outbox delivery: %s", exc)
+
+
+def claim_batches() -> Dict[uuid.UUID, List[LeadOutbox]]:
+    """
+    Lock due outbox rows and group them into batches.
+
+    Rows keep their ``batch_key`` across retries so the webhook receives the
+    same idempotency key for the same set of leads. Claimed rows are leased
+    by pushing ``next_attempt_at`` forward; a crashed worker's rows become due
+    again once the lease expires.
+    """
+    now = timezone.now()
+    batch_size = settings.CRM_WEBHOOK_BATCH_SIZE
+    limit = batch_size * settings.CRM_WEBHOOK_CONCURRENCY
+    lease = timedelta(
+        seconds=settings.CRM_WEBHOOK_CONNECT_TIMEOUT + settings.CRM_WEBHOOK_READ_TIMEOUT + 30
+    )
+
+    with transaction.atomic():
+        entries = list(
+            LeadOutbox.objects.select_for_update(skip_locked=True, of=("self",))
+            .select_related("lead")
+            .filter(
+                status__in=[LeadOutbox.Status.PENDING, LeadOutbox.Status.IN_FLIGHT],
+                next_attempt_at__lte=now,
+            )
+            .order_by("next_attempt_at", "id")[:limit]
+        )
+        # A retried batch must be resent whole under its original key.
+        retry_keys = {entry.batch_key for entry in entries if entry.batch_key}
+        if retry_keys:
+            entries += list(
+                LeadOutbox.objects.select_for_update(skip_locked=True, of=("self",))
+                .select_related("lead")
+                .filter(
+                    batch_key__in=retry_keys,
+                    status__in=[LeadOutbox.Status.PENDING, LeadOutbox.Status.IN_FLIGHT],
+                )
+                .exclude(pk__in=[entry.pk for entry in entries])
+            )
+
+        batches: Dict[uuid.UUID, List[LeadOutbox]] = {}
+        unassigned: List[LeadOutbox] = []
+        for entry in entries:
+            if entry.batch_key:
+                batches.setdefault(entry.batch_key, []).append(entry)
+            else:
+                unassigned.append(entry)
+
+        for start in range(0, len(unassigned), batch_size):
+            batch_key = uuid.uuid4()
+            for entry in unassigned[start:start + batch_size]:
+                entry.batch_key = batch_key
+            batches[batch_key] = unassigned[start:start + batch_size]
+
+        for entry in entries:
+            entry.status = LeadOutbox.Status.IN_FLIGHT
+            entry.next_attempt_at = now + lease
+        LeadOutbox.objects.bulk_update(entries, ["status", "batch_key", "next_attempt_at"])
+
+    return batches
+
+
+def serialize_batch(batch_key: uuid.UUID, entries: List[LeadOutbox]) -> Dict[str, Any]:
+    return {
+        "idempotency_key": str(batch_key),
+        "leads": [
+            {
+                "id": entry.lead_id,
+                "phone_number": entry.lead.phone_number,
+                "status": entry.lead.status,
+                "created_at": entry.lead.created_at.isoformat(),
+            }
+            for entry in entries
+        ],
+    }
+
+
+def post_batch(batch_key: uuid.UUID, entries: List[LeadOutbox]) -> str | None:
+    """POST one batch; return ``None`` on success or an error description."""
+    headers = {"Idempotency-Key": str(batch_key)}
+    token = getattr(settings, "CRM_WEBHOOK_TOKEN", "")
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+
+    try:
+        response = get_http_pool().request(
+            "POST",
+            settings.CRM_WEBHOOK_URL,
+            body=json.dumps(serialize_batch(batch_key, entries)).encode("utf-8"),
+            headers=headers,
+        )
+    except urllib3.exceptions.HTTPError as exc:
+        return f"{type(exc).__name__}: {exc}"
+
+    if 200 <= response.status < 300:
+        return None
+    return f"HTTP {response.status}: {response.data[:200].decode('utf-8', 'replace')}"
+
+
+def record_result(entries: List[LeadOutbox], error: str | None) -> None:
+    now = timezone.now()
+    ids = [entry.pk for entry in entries]
+
+    if error is None:
+        LeadOutbox.objects.filter(pk__in=ids).update(
+            status=LeadOutbox.Status.DELIVERED,
+            delivered_at=now,
+            last_error="",
+        )
+        return
+
+    attempts = max(entry.attempts for entry in entries) + 1
+    if attempts >= settings.CRM_WEBHOOK_MAX_ATTEMPTS:
+        status = LeadOutbox.Status.FAILED
+    else:
+        status = LeadOutbox.Status.PENDING
+    backoff = min(settings.CRM_WEBHOOK_RETRY_BACKOFF * 2 ** (attempts - 1), 3600)
+    LeadOutbox.objects.filter(pk__in=ids).update(
+        status=status,
+        attempts=attempts,
+        next_attempt_at=now + timedelta(seconds=backoff),
+        last_error=error,
+    )
+
+
+def deliver_pending() -> Dict[str, int]:
+    """Claim due outbox rows and deliver them in concurrent batches."""
+    if not is_enabled():
+        return {"batches": 0, "delivered": 0, "failed": 0}
+
+    batches = claim_batches()
+    summary = {"batches": len(batches), "delivered": 0, "failed": 0}
+    if not batches:
+        return summary
+
+    with ThreadPoolExecutor(max_workers=settings.CRM_WEBHOOK_CONCURRENCY) as executor:
+        futures = {
+            batch_key: executor.submit(post_batch, batch_key, entries)
+            for batch_key, entries in batches.items()
+        }
+
+    for batch_key, future in futures.items():
+        entries = batches[batch_key]
+        error = future.result()
+        if error:
+            logger.warning("Webhook delivery of batch %s failed: %s", batch_key, error)
+            summary["failed"] += len(entries)
+        else:
+            summary["delivered"] += len(entries)
+        record_result(entries, error)
+
+    return summary
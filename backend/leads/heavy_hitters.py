@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+import hashlib
+import ipaddress
+import logging
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "heavy_hitters"
+
+
+class CountMinSketch:
+    """Fixed-size frequency estimator that never under-counts a key."""
+
+    def __init__(self, width: int = 2048, depth: int = 4) -> None:
+        self.width = width
+        self.depth = depth
+        self.rows: List[List[int]] = [[0] * width for _ in range(depth)]
+
+    def _indexes(self, key: str) -> List[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=4 * self.depth).digest()
+        return [
+            int.from_bytes(digest[row * 4:(row + 1) * 4], "little") % self.width
+            for row in range(self.depth)
+        ]
+
+    def add(self, key: str, count: int = 1) -> int:
+        """Increment ``key`` and return its new estimated count."""
+        estimate = None
+        for row, index in zip(self.rows, self._indexes(key)):
+            row[index] += count
+            estimate = row[index] if estimate is None else min(estimate, row[index])
+        return estimate or 0
+
+    def estimate(self, key: str) -> int:
+        return min(row[index] for row, index in zip(self.rows, self._indexes(key)))
+
+
+class _Window:
+    """Counts for a single time window on one dimension."""
+
+    def __init__(self, window_id: int, width: int, depth: int) -> None:
+        self.window_id = window_id
+        self.sketch = CountMinSketch(width, depth)
+        self.candidates: Dict[str, int] = {}
+
+
+class HeavyHitterDetector:
+    """
+    Per-process heavy-hitter tracker with sliding-window decay.
+
+    Each dimension (user agent per network, phone prefix) keeps a Count-Min sketch for
+    the current and previous window; the previous window is weighted down as
+    the current one progresses. The top-k candidates are flushed periodically
+    into Redis sorted sets so every web process sees the merged counts.
+    """
+
+    def __init__(
+        self,
+        *,
+        thresholds: Dict[str, int],
+        window_seconds: int = 60,
+        top_k: int = 50,
+        flush_interval: float = 2.0,
+        sketch_width: int = 2048,
+        sketch_depth: int = 4,
+        phone_prefix_length: int = 7,
+        redis_client: Any = None,
+    ) -> None:
+        self.thresholds = thresholds
+        self.window_seconds = window_seconds
+        self.top_k = top_k
+        self.flush_interval = flush_interval
+        self.sketch_width = sketch_width
+        self.sketch_depth = sketch_depth
+        self.phone_prefix_length = phone_prefix_length
+        self.redis = redis_client
+
+        self._lock = threading.Lock()
+        self._current: Dict[str, _Window] = {}
+        self._previous: Dict[str, _Window] = {}
+        self._pending: Dict[str, Dict[str, int]] = {}
+        self._global: Dict[str, Dict[str, float]] = {}
+        self._last_flush = 0.0
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def extract_keys(self, phone_number: str, metadata: Dict[str, Any]) -> Dict[str, str]:
+        """Map a submission onto the tracked dimensions."""
+        # Reduced user-agent strings are shared by most mobile visitors, so the
+        # UA is only counted together with the client's network prefix.
+        user_agent = (metadata.get("user_agent") or "")[:256]
+        network = _network_prefix(metadata.get("ip"))
+        keys = {
+            "user_agent": f"{network} {user_agent}" if user_agent and network else "",
+            "phone_prefix": (phone_number or "")[: self.phone_prefix_length],
+        }
+        return {
+            dimension: value
+            for dimension, value in keys.items()
+            if value and dimension in self.thresholds
+        }
+
+    def observe(self, phone_number: str, metadata: Dict[str, Any]) -> List[str]:
+        """Record a submission and return the dimensions that are currently hot."""
+        now = time.time()
+        hot: List[str] = []
+
+        with self._lock:
+            for dimension, key in self.extract_keys(phone_number, metadata).items():
+                estimate = self._record(dimension, key, now)
+                if estimate >= self.thresholds[dimension]:
+                    hot.append(dimension)
+
+            should_flush = now - self._last_flush >= self.flush_interval
+            if should_flush:
+                self._last_flush = now
+
+        if should_flush:
+            self.flush(now)
+        return hot
+
+    def top_offenders(self, limit: Optional[int] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Return the heaviest keys per dimension, merged across processes when possible."""
+        limit = limit or self.top_k
+        now = time.time()
+        self.flush(now)
+
+        with self._lock:
+            result: Dict[str, List[Dict[str, Any]]] = {}
+            for dimension, threshold in self.thresholds.items():
+                merged = self._global.get(dimension) or self._local_counts(dimension, now)
+                ranked = sorted(merged.items(), key=lambda item: item[1], reverse=True)[:limit]
+                result[dimension] = [
+                    {"key": key, "count": round(count, 1), "hot": count >= threshold}
+                    for key, count in ranked
+                ]
+            return result
+
+    def flush(self, now: Optional[float] = None) -> None:
+        """Push pending local deltas to Redis and refresh the merged view."""
+        if self.redis is None:
+            return
+
+        now = now or time.time()
+        window_id = int(now // self.window_seconds)
+        weight = self._previous_weight(now)
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        reads: List[int] = []
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            queued = 0
+            for dimension in self.thresholds:
+                current_key = self._redis_key(dimension, window_id)
+                for key, count in pending.get(dimension, {}).items():
+                    pipe.zincrby(current_key, count, key)
+                    queued += 1
+                pipe.zremrangebyrank(current_key, 0, -(self.top_k * 4) - 1)
+                pipe.expire(current_key, self.window_seconds * 2)
+                reads.append(queued + 2)
+                queued += 4
+                pipe.zrevrange(current_key, 0, self.top_k - 1, withscores=True)
+                pipe.zrevrange(
+                    self._redis_key(dimension, window_id - 1),
+                    0,
+                    self.top_k - 1,
+                    withscores=True,
+                )
+            replies = pipe.execute()
+        except Exception as exc:  # Redis unavailable; keep local-only view
+            logger.warning("Unable to merge heavy-hitter counts through Redis: %s", exc)
+            with self._lock:
+                for dimension, counts in pending.items():
+                    current = self._pending.setdefault(dimension, {})
+                    for key, count in counts.items():
+                        current[key] = current.get(key, 0) + count
+            return
+
+        merged: Dict[str, Dict[str, float]] = {}
+        for index, dimension in zip(reads, self.thresholds):
+            current_rows = replies[index] or []
+            previous_rows = replies[index + 1] or []
+            counts: Dict[str, float] = {}
+            for key, score in previous_rows:
+                counts[_decode(key)] = score * weight
+            for key, score in current_rows:
+                counts[_decode(key)] = counts.get(_decode(key), 0.0) + score
+            merged[dimension] = counts
+
+        with self._lock:
+            self._global = merged
+
+    # ------------------------------------------------------------------
+    # Internals (callers hold ``self._lock``)
+    # ------------------------------------------------------------------
+    def _record(self, dimension: str, key: str, now: float) -> float:
+        window = self._window_for(dimension, now)
+        local_count = window.sketch.add(key)
+
+        window.candidates[key] = local_count
+        if len(window.candidates) > self.top_k * 2:
+            coldest = min(window.candidates, key=window.candidates.__getitem__)
+            window.candidates.pop(coldest, None)
+
+        previous = self._previous.get(dimension)
+        weight = self._previous_weight(now)
+        local_estimate = local_count
+        if previous is not None and previous.window_id == window.window_id - 1:
+            local_estimate += previous.sketch.estimate(key) * weight
+
+        # Deltas only accumulate for the Redis merge; without Redis they
+        # would never be flushed and would grow across windows.
+        if self.redis is None:
+            return local_estimate
+
+        if key in window.candidates:
+            pending = self._pending.setdefault(dimension, {})
+            pending[key] = pending.get(key, 0) + 1
+
+        unflushed = self._pending.get(dimension, {}).get(key, 0)
+        global_estimate = self._global.get(dimension, {}).get(key, 0.0) + unflushed
+        return max(local_estimate, global_estimate)
+
+    def _window_for(self, dimension: str, now: float) -> _Window:
+        window_id = int(now // self.window_seconds)
+        window = self._current.get(dimension)
+        if window is None or window.window_id != window_id:
+            if window is not None:
+                self._previous[dimension] = window
+            window = _Window(window_id, self.sketch_width, self.sketch_depth)
+            self._current[dimension] = window
+        return window
+
+    def _local_counts(self, dimension: str, now: float) -> Dict[str, float]:
+        window = self._window_for(dimension, now)
+        counts: Dict[str, float] = dict(window.candidates)
+        previous = self._previous.get(dimension)
+        if previous is not None and previous.window_id == window.window_id - 1:
+            weight = self._previous_weight(now)
+            for key in previous.candidates:
+                counts[key] = counts.get(key, 0) + previous.sketch.estimate(key) * weight
+        return counts
+
+    def _previous_weight(self, now: float) -> float:
+        elapsed = (now % self.window_seconds) / self.window_seconds
+        return 1.0 - elapsed
+
+    def _redis_key(self, dimension: str, window_id: int) -> str:
+        return f"{REDIS_KEY_PREFIX}:{dimension}:{window_id}"
+
+
+def _network_prefix(ip: Optional[str]) -> str:
+    """Collapse a client address to its /24 (IPv4) or /48 (IPv6) network."""
+    if not ip:
+        return ""
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return ""
+    prefix = 24 if address.version == 4 else 48
+    return str(ipaddress.ip_network(f"{address}/{prefix}", strict=False))
+
+
+def _decode(value: Any) -> str:
+    return value.decode("utf-8", "replace") if isinstance(value, bytes) else str(value)
+
+
+def _get_redis_client() -> Any:
+    if not getattr(settings, "REDIS_URL", None):
+        return None
+    try:
+        from django_redis import get_redis_connection
+
+        return get_redis_connection("default")
+    except Exception as exc:  # pragma: no cover - optional dependency in local mode
+        logger.warning("Heavy-hitter detector running without Redis: %s", exc)
+        return None
+
+
+@lru_cache
+def get_detector() -> HeavyHitterDetector:
+    """Return the process-wide heavy-hitter detector."""
+    return HeavyHitterDetector(
+        thresholds=dict(getattr(settings, "HEAVY_HITTER_THRESHOLDS", {})),
+        window_seconds=getattr(settings, "HEAVY_HITTER_WINDOW_SECONDS", 60),
+        top_k=getattr(settings, "HEAVY_HITTER_TOP_K", 50),
+        flush_interval=getattr(settings, "HEAVY_HITTER_FLUSH_INTERVAL", 2.0),
+        phone_prefix_length=getattr(settings, "HEAVY_HITTER_PHONE_PREFIX_LENGTH", 7),
+        redis_client=_get_redis_client(),
+    )
+
+
+def detect_hot_keys(phone_number: str, metadata: Dict[str, Any]) -> List[str]:
+    """
+    Observe a submission and return the dimensions that are currently hot.
+
+    Detection failures never block leads; they simply report nothing hot.
+    """
+    if not getattr(settings, "HEAVY_HITTER_ENABLE", False):
+        return []
+    try:
+        return get_detector().observe(phone_number, metadata)
+    except Exception as exc:  # pragma: no cover - defensive
+        logger.warning("Heavy-hitter detection failed: %s", exc)
+        return []
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import logging
 from functools import lru_cache
-from typing import Any, Dict
+from typing import Any, Dict, Iterable
 
 from django.conf import settings
 from django.utils import timezone
@@ -48,3 +48,39 @@ def log_request_event(
         collection.insert_one(log_entry)
     except PyMongoError as exc:
         logger.warning("Unable to write log entry to MongoDB: %s", exc)
+
+
+def log_request_events(
+    phone_numbers: Iterable[str],
+    metadata: Dict[str, Any] | None = None,
+    *,
+    success: bool,
+    error: str | None = None,
+) -> None:
+    """Persist one log entry per phone number with a single bulk insert."""
+    metadata = metadata or {}
+
+    mongo_db = getattr(settings, "MONGO_DB_NAME", None)
+    if not mongo_db:
+        logger.debug("MongoDB name not set; skipping log entries.")
+        return
+
+    timestamp = timezone.now()
+    log_entries = [
+        {
+            "phone_number": phone_number,
+            "success": success,
+            "error": error,
+            "timestamp": timestamp,
+            "metadata": metadata,
+        }
+        for phone_number in phone_numbers
+    ]
+    if not log_entries:
+        return
+
+    try:
+        collection = get_mongo_client()[mongo_db]["request_logs"]
+        collection.insert_many(log_entries, ordered=False)
+    except PyMongoError as exc:
+        logger.warning("Unable to write log entries to MongoDB: %s", exc)
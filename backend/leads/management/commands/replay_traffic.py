@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import json
+import math
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import urllib3
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, math.ceil(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+def synthetic_ip(client: str) -> Optional[str]:
+    """
+    Map an anonymised client token onto a stable private address.
+
+    ``<network>:<host>`` tokens keep clients of one real network inside one
+    synthetic ``10.x.y.0/24``; older host-only tokens get unrelated networks.
+    """
+    if not client:
+        return None
+    if ":" in client:
+        network, host = client.split(":", 1)
+        value = int(network[:4], 16)
+        return f"10.{value >> 8}.{value & 255}.{int(host[:4], 16) % 254 + 1}"
+    value = int(client[:6], 16)
+    return f"10.{value >> 16 & 255}.{value >> 8 & 255}.{value & 255}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a traffic capture (TRAFFIC_CAPTURE_PATH JSONL) against a running "
+        "instance at N times the recorded speed and report latency and errors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("capture", help="JSONL file written by TrafficCaptureMiddleware.")
+        parser.add_argument("--target", default="http://localhost:8010", help="Base URL to replay against.")
+        parser.add_argument("--speed", type=float, default=1.0, help="Time scale; 10 replays ten times faster.")
+        parser.add_argument("--concurrency", type=int, default=50, help="Maximum requests in flight.")
+        parser.add_argument("--timeout", type=float, default=10.0, help="Per-request timeout in seconds.")
+        parser.add_argument("--limit", type=int, default=0, help="Replay only the first N requests.")
+
+    def handle(self, *args, **options):
+        if options["speed"] <= 0 or options["concurrency"] <= 0:
+            raise CommandError("--speed and --concurrency must be positive.")
+
+        records = self._load(options["capture"], options["limit"])
+        if not records:
+            raise CommandError("No requests found in the capture file.")
+
+        target = options["target"].rstrip("/")
+        speed = options["speed"]
+        http = urllib3.PoolManager(
+            maxsize=options["concurrency"],
+            block=True,
+            retries=False,
+            timeout=urllib3.Timeout(total=options["timeout"]),
+        )
+
+        recorded_span = records[-1]["ts"] - records[0]["ts"]
+        self.stdout.write(
+            f"Replaying {len(records)} requests spanning {recorded_span:.1f}s "
+            f"at {speed:g}x against {target} (concurrency {options['concurrency']})"
+        )
+
+        started = time.monotonic()
+        first_ts = records[0]["ts"]
+        futures = []
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            for record in records:
+                due = started + (record["ts"] - first_ts) / speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(executor.submit(self._send, http, target, record, due))
+        elapsed = time.monotonic() - started
+
+        self._report([future.result() for future in futures], elapsed)
+
+    def _load(self, path: str, limit: int) -> List[Dict[str, Any]]:
+        records = []
+        try:
+            with open(path, encoding="utf-8") as capture:
+                for line in capture:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if "ts" in record and "path" in record:
+                        records.append(record)
+        except OSError as exc:
+            raise CommandError(f"Unable to read capture: {exc}") from exc
+
+        # Several worker processes append to one file, so order is approximate.
+        records.sort(key=lambda record: record["ts"])
+        return records[:limit] if limit else records
+
+    def _send(self, http, target: str, record: Dict[str, Any], due: float) -> Dict[str, Any]:
+        method = record.get("method", "GET")
+        headers = {"User-Agent": record.get("user_agent") or "replay-traffic"}
+        forwarded_for = synthetic_ip(record.get("client", ""))
+        if forwarded_for:
+            headers["X-Forwarded-For"] = forwarded_for
+
+        body = None
+        if method == "POST":
+            headers["Content-Type"] = "application/json"
+            payload = record.get("body") or {}
+            body = b"{invalid" if payload.get("invalid") else json.dumps(payload).encode("utf-8")
+
+        sent = time.monotonic()
+        result = {"path": record["path"], "lag": max(0.0, sent - due), "status": None, "error": None}
+        try:
+            response = http.request(method, target + record["path"], body=body, headers=headers)
+            result["status"] = response.status
+        except urllib3.exceptions.HTTPError as exc:
+            result["error"] = type(exc).__name__
+        result["latency"] = time.monotonic() - sent
+        return result
+
+    def _report(self, results: List[Dict[str, Any]], elapsed: float) -> None:
+        by_path: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for result in results:
+            by_path[result["path"]].append(result)
+
+        self.stdout.write(f"\nSent {len(results)} requests in {elapsed:.1f}s ({len(results) / max(elapsed, 1e-9):.1f} req/s)\n")
+        header = f"{'path':<20} {'count':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}  statuses"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for path, rows in sorted(by_path.items()):
+            self._write_row(path, rows)
+        self._write_row("all", results)
+
+        lags = sorted(result["lag"] for result in results)
+        self.stdout.write(
+            f"\nSchedule lag (client-side queueing): p50 {percentile(lags, 50) * 1000:.1f} ms, "
+            f"p99 {percentile(lags, 99) * 1000:.1f} ms"
+        )
+
+        errors = Counter(result["error"] for result in results if result["error"])
+        failures = sum(errors.values()) + sum(
+            1 for result in results if result["status"] and result["status"] >= 500
+        )
+        self.stdout.write(f"Errors: {failures} ({failures / len(results):.2%})")
+        for name, count in errors.most_common(5):
+            self.stdout.write(f"  {name}: {count}")
+
+    def _write_row(self, label: str, rows: List[Dict[str, Any]]) -> None:
+        latencies = sorted(row["latency"] * 1000 for row in rows)
+        statuses = Counter(str(row["status"] or "error") for row in rows)
+        status_text = " ".join(f"{status}:{count}" for status, count in sorted(statuses.items()))
+        self.stdout.write(
+            f"{label:<20} {len(rows):>7} {percentile(latencies, 50):>9.1f} "
+            f"{percentile(latencies, 90):>9.1f} {percentile(latencies, 99):>9.1f} "
+            f"{(latencies[-1] if latencies else 0):>9.1f}  {status_text}"
+        )
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .heavy_hitters import _network_prefix
+from .utils import get_client_ip
+from .validators import PHONE_PATTERN
+
+logger = logging.getLogger(__name__)
+
+
+def _digest(value: str) -> str:
+    salt = (settings.TRAFFIC_CAPTURE_SALT or settings.SECRET_KEY).encode("utf-8")
+    return hmac.new(salt, value.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def anonymise_phone(phone_number: str) -> str:
+    """
+    Replace the trailing digits with a keyed hash, keeping the first
+    ``HEAVY_HITTER_PHONE_PREFIX_LENGTH`` digits and the format so replays still
+    validate, phone-prefix heavy hitters stay hot and repeat submitters stay
+    repeated.
+    """
+    if not PHONE_PATTERN.match(phone_number or ""):
+        return ""
+    keep = min(settings.HEAVY_HITTER_PHONE_PREFIX_LENGTH, len(phone_number) - 1)
+    hashed = len(phone_number) - keep
+    suffix = int(_digest(phone_number), 16) % 10**hashed
+    return f"{phone_number[:keep]}{suffix:0{hashed}d}"
+
+
+def anonymise_client(ip: str | None) -> str:
+    """
+    Hash the client's /24 (/48 for IPv6) network and the full address
+    separately as ``<network>:<host>`` so replays keep clients grouped by
+    network, which heavy-hitter user-agent keys depend on.
+    """
+    if not ip:
+        return ""
+    network = _network_prefix(ip)
+    if not network:
+        return _digest(ip)[:16]
+    return f"{_digest(network)[:6]}:{_digest(ip)[:10]}"
+
+
+class TrafficCaptureMiddleware:
+    """
+    Append anonymised landing / submit requests to a JSONL file for replay.
+
+    Enabled only when ``TRAFFIC_CAPTURE_PATH`` is set; see the
+    ``replay_traffic`` management command for the consumer side.
+    """
+
+    def __init__(self, get_response) -> None:
+        self.output_path = getattr(settings, "TRAFFIC_CAPTURE_PATH", "")
+        if not self.output_path:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.paths = set(settings.TRAFFIC_CAPTURE_PATHS)
+        self._lock = threading.Lock()
+        self._file = open(self.output_path, "a", encoding="utf-8")
+
+    def __call__(self, request):
+        if request.path not in self.paths:
+            return self.get_response(request)
+
+        started = time.time()
+        body = self._anonymised_body(request) if request.method == "POST" else None
+        response = self.get_response(request)
+
+        self._write(
+            {
+                "ts": round(started, 6),
+                "method": request.method,
+                "path": request.path,
+                "content_type": request.content_type if body is not None else None,
+                "body": body,
+                "client": anonymise_client(get_client_ip(request)),
+                "user_agent": request.META.get("HTTP_USER_AGENT", "")[:256],
+                "status": response.status_code,
+                "duration_ms": round((time.time() - started) * 1000, 3),
+            }
+        )
+        return response
+
+    def _anonymised_body(self, request) -> Dict[str, Any] | None:
+        try:
+            payload = json.loads(request.body or "{}")
+        except (ValueError, UnicodeDecodeError):
+            return {"invalid": True}
+        if not isinstance(payload, dict):
+            return {"invalid": True}
+        phone_number = payload.get("phone")
+        if not isinstance(phone_number, str):
+            return {}
+        return {"phone": anonymise_phone(phone_number.strip()) or "invalid"}
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        try:
+            with self._lock:
+                self._file.write(line)
+                self._file.flush()
+        except OSError as exc:
+            logger.warning("Unable to write traffic capture record: %s", exc)
@@ -47,3 +47,36 @@ class Lead(models.Model):
         self.status = status or self.Status.PROCESSED
         self.processed_at = timezone.now()
         self.save(update_fields=["status", "processed_at", "updated_at"])
+
+
+class LeadOutbox(models.Model):
+    """Durable record of a lead awaiting delivery to the CRM webhook."""
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        IN_FLIGHT = "in_flight", "In flight"
+        DELIVERED = "delivered", "Delivered"
+        FAILED = "failed", "Failed"
+
+    lead = models.ForeignKey(Lead, on_delete=models.CASCADE, related_name="outbox_entries")
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.PENDING,
+    )
+    batch_key = models.UUIDField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "lead_outbox"
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+            models.Index(fields=["batch_key"]),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.lead_id} ({self.status})"
@@ -4,12 +4,13 @@ import logging
 
 from celery import shared_task
 from django.core.exceptions import ValidationError
-from django.db import transaction
+from django.db import connection, transaction
 from django.utils import timezone
 
-from .logging import log_request_event
+from . import delivery
+from .logging import log_request_event, log_request_events
 from .models import Lead
-from .validators import validate_phone_number
+from .validators import PHONE_PATTERN, validate_phone_number
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +36,9 @@ def process_lead_submission(self, phone_number: str, metadata: dict[str, str] |
                 lead.status = Lead.Status.DUPLICATE
                 lead.save(update_fields=["status", "updated_at"])
 
+            if created:
+                delivery.enqueue_leads([lead])
+
         log_request_event(
             phone_number,
             {**metadata, "created": created},
@@ -66,3 +70,82 @@ def process_lead_submission(self, phone_number: str, metadata: dict[str, str] |
             error=str(exc),
         )
         raise self.retry(exc=exc, countdown=min(60 * (self.request.retries + 1), 300))
+
+
+def _insert_new_leads(phone_numbers: list[str], now) -> list[tuple[int, str]]:
+    """
+    Insert leads, skipping numbers that already exist, and return ``(id, phone)``
+    for the rows this statement actually created.
+
+    ``bulk_create(ignore_conflicts=True)`` cannot tell inserted rows from
+    skipped ones, so this uses ``ON CONFLICT DO NOTHING RETURNING`` directly
+    (PostgreSQL, SQLite 3.35+).
+    """
+    if not phone_numbers:
+        return []
+
+    stamp = Lead._meta.get_field("created_at").get_db_prep_value(now, connection)
+    params: list = []
+    for phone_number in phone_numbers:
+        params.extend([phone_number, Lead.Status.PROCESSED.value, stamp, stamp, stamp])
+
+    quote = connection.ops.quote_name
+    columns = ", ".join(
+        quote(name) for name in ("phone_number", "status", "created_at", "updated_at", "processed_at")
+    )
+    values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(phone_numbers))
+    sql = (
+        f"INSERT INTO {quote(Lead._meta.db_table)} ({columns}) VALUES {values} "
+        f"ON CONFLICT ({quote('phone_number')}) DO NOTHING "
+        f"RETURNING {quote('id')}, {quote('phone_number')}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(row[0], row[1]) for row in cursor.fetchall()]
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def process_lead_batch(self, phone_numbers: list[str], metadata: dict[str, str] | None = None):
+    """Persist a chunk of pre-validated leads with bulk queries."""
+    metadata = metadata or {}
+    phone_numbers = [number for number in phone_numbers if PHONE_PATTERN.match(number or "")]
+
+    try:
+        with transaction.atomic():
+            now = timezone.now()
+            inserted = _insert_new_leads(phone_numbers, now)
+            delivery.enqueue_leads(
+                Lead(pk=lead_id, phone_number=phone_number) for lead_id, phone_number in inserted
+            )
+
+            created = [phone_number for _, phone_number in inserted]
+            duplicates = set(phone_numbers) - set(created)
+            if duplicates:
+                Lead.objects.filter(phone_number__in=duplicates).exclude(
+                    status=Lead.Status.DUPLICATE
+                ).update(status=Lead.Status.DUPLICATE, updated_at=now)
+
+        log_request_events(created, {**metadata, "created": True}, success=True)
+        log_request_events(duplicates, {**metadata, "created": False}, success=True)
+
+        return {
+            "created": len(created),
+            "duplicates": len(duplicates),
+        }
+
+    except Exception as exc:  # pragma: no cover - defensive logging
+        logger.exception("Celery batch task failed for %d leads", len(phone_numbers))
+        raise self.retry(exc=exc, countdown=min(60 * (self.request.retries + 1), 300))
+
+
+@shared_task(ignore_result=True)
+def deliver_lead_outbox(max_rounds: int = 10):
+    """Drain due outbox rows to the CRM webhook in batches."""
+    totals = {"batches": 0, "delivered": 0, "failed": 0}
+    for _ in range(max_rounds):
+        summary = delivery.deliver_pending()
+        for key, value in summary.items():
+            totals[key] += value
+        if summary["batches"] == 0:
+            break
+    return totals
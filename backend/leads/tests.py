@@ -1,3 +1,635 @@
-from django.test import TestCase
+import io
+import json
+import threading
+import time
+import uuid
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from high_traffic import autoscale
+
+from . import delivery
+from .admission import AdaptiveLimiter
+from .bulk import MAX_ELEMENT_BYTES, BulkParseError, iter_json_array, iter_ndjson
+from .heavy_hitters import HeavyHitterDetector
+from .management.commands.replay_traffic import percentile, synthetic_ip
+from .middleware import anonymise_client, anonymise_phone
+from .models import Lead, LeadOutbox
+from .tasks import process_lead_batch
+from .validators import PHONE_PATTERN
+
+
+class HeavyHitterDetectorTests(SimpleTestCase):
+    def make_detector(self, **kwargs):
+        options = {
+            "thresholds": {"user_agent": 3, "phone_prefix": 100},
+            "window_seconds": 60,
+            "flush_interval": 3600,
+        }
+        options.update(kwargs)
+        return HeavyHitterDetector(**options)
+
+    def observe_at(self, detector, now, ip="10.0.0.1", ua="UA", phone="09123456789"):
+        with mock.patch("leads.heavy_hitters.time.time", return_value=now):
+            return detector.observe(phone, {"ip": ip, "user_agent": ua})
+
+    def test_user_agent_turns_hot_at_threshold_within_network(self):
+        detector = self.make_detector()
+        hits = [self.observe_at(detector, 600.0 + i, ip=f"10.0.0.{i}") for i in range(4)]
+        self.assertEqual(hits, [[], [], ["user_agent"], ["user_agent"]])
+
+    def test_same_user_agent_on_other_networks_is_not_merged(self):
+        detector = self.make_detector()
+        hits = [self.observe_at(detector, 600.0, ip=f"10.0.{i}.1") for i in range(5)]
+        self.assertEqual(hits, [[]] * 5)
+
+    def test_user_agent_without_ip_is_ignored(self):
+        detector = self.make_detector()
+        self.assertEqual(detector.extract_keys("09123456789", {"user_agent": "UA"}), {"phone_prefix": "0912345"})
+
+    def test_previous_window_decays_after_rollover(self):
+        detector = self.make_detector()
+        for _ in range(3):
+            self.observe_at(detector, 600.0)
+        # Just after rollover the previous window still counts almost fully.
+        self.assertEqual(self.observe_at(detector, 660.5), ["user_agent"])
+        # Near the end of the next window the old counts have nearly faded.
+        self.assertEqual(self.observe_at(detector, 719.0), [])
+        # Two windows later nothing from the first window remains.
+        self.assertEqual(self.observe_at(detector, 800.0), [])
+
+    def test_failed_flush_keeps_pending_counts(self):
+        redis_client = mock.Mock()
+        redis_client.pipeline.return_value.execute.side_effect = ConnectionError("down")
+        detector = self.make_detector(redis_client=redis_client)
+        self.observe_at(detector, 600.0)
+
+        detector.flush(601.0)
+
+        self.assertEqual(detector._pending["user_agent"], {"10.0.0.0/24 UA": 1})
+        self.assertEqual(detector._pending["phone_prefix"], {"0912345": 1})
+
+
+@override_settings(
+    HEAVY_HITTER_ENABLE=True,
+    HEAVY_HITTER_LOW_PRIORITY_QUEUE="leads_low",
+    ADMISSION_ENABLE=False,
+    MONGO_DB_NAME="",
+)
+class SubmitHeavyHitterTests(TestCase):
+    def setUp(self):
+        self.detector = HeavyHitterDetector(
+            thresholds={"user_agent": 100, "phone_prefix": 2}, window_seconds=60, flush_interval=3600
+        )
+        patcher = mock.patch("leads.heavy_hitters.get_detector", return_value=self.detector)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submit(self, phone):
+        return self.client.post(
+            "/api/leads/", data=json.dumps({"phone": phone}), content_type="application/json"
+        )
+
+    @mock.patch("leads.views.process_lead_submission")
+    def test_hot_submissions_are_routed_to_low_priority_queue(self, task):
+        task.delay.return_value.id = "normal"
+        task.apply_async.return_value.id = "low"
+
+        self.assertEqual(self.submit("09123456781").status_code, 202)
+        task.delay.assert_called_once()
+        self.assertNotIn("heavy_hitter", task.delay.call_args.kwargs["metadata"])
+
+        response = self.submit("09123456782")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["task_id"], "low")
+        kwargs = task.apply_async.call_args.kwargs
+        self.assertEqual(kwargs["queue"], "leads_low")
+        self.assertEqual(kwargs["kwargs"]["metadata"]["heavy_hitter"], ["phone_prefix"])
+
+    @override_settings(HEAVY_HITTER_ACTION="reject")
+    @mock.patch("leads.views.process_lead_submission")
+    def test_hot_submissions_are_rejected_when_configured(self, task):
+        task.delay.return_value.id = "normal"
+        self.submit("09123456781")
+        response = self.submit("09123456782")
+
+        self.assertEqual(response.status_code, 429)
+        task.apply_async.assert_not_called()
+        self.assertEqual(task.delay.call_count, 1)
+
+    def test_offenders_view_is_staff_only(self):
+        url = "/api/heavy-hitters/"
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.detector.observe("09123456781", {})
+        self.detector.observe("09123456782", {})
+        staff = User.objects.create_user("staff", password="x", is_staff=True)
+        self.client.force_login(staff)
+        with mock.patch("leads.views.get_detector", return_value=self.detector):
+            response = self.client.get(url, {"limit": "5"})
+            bad_limit = self.client.get(url, {"limit": "many"})
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["thresholds"], {"user_agent": 100, "phone_prefix": 2})
+        self.assertFalse(body["merged"])
+        self.assertEqual(body["offenders"]["phone_prefix"][0], {"key": "0912345", "count": 2, "hot": True})
+        self.assertEqual(bad_limit.status_code, 400)
+
+
+class BulkParserTests(SimpleTestCase):
+    def parse(self, body, chunk_size=64 * 1024):
+        return [value for value, _ in iter_json_array(io.BytesIO(body), chunk_size)]
+
+    def test_elements_split_across_chunk_boundaries(self):
+        values = ["09123456789", {"phone": "09123456780"}, 12345, "ا"]
+        body = json.dumps(values * 50).encode("utf-8")
+        for chunk_size in (1, 2, 7, 64):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(self.parse(body, chunk_size), values * 50)
+
+    def test_empty_array(self):
+        self.assertEqual(self.parse(b" [ ] \n"), [])
+
+    def test_rejects_malformed_arrays(self):
+        for body in (b"[1,]", b"[1 2]", b"[1,", b"", b'{"phone": "09123456789"}', b"[1] garbage", b"[1]]"):
+            with self.subTest(body=body), self.assertRaises(BulkParseError):
+                self.parse(body, chunk_size=2)
+
+    def test_rejects_oversized_element_without_reading_everything(self):
+        body = b'["' + b"9" * (8 * 1024 * 1024) + b'"]'
+        stream = io.BytesIO(body)
+        with self.assertRaises(BulkParseError):
+            list(iter_json_array(stream, chunk_size=4096))
+        self.assertLess(stream.tell(), 4 * MAX_ELEMENT_BYTES + 8192)
+
+    def test_ndjson_bad_lines_are_row_errors(self):
+        rows = list(iter_ndjson(io.BytesIO(b'"09123456789"\n\nnope\n{"phone": "x"}')))
+        self.assertEqual(rows, [("09123456789", None), (None, "Invalid JSON."), ({"phone": "x"}, None)])
+
+    def test_ndjson_rejects_overlong_line(self):
+        with self.assertRaises(BulkParseError):
+            list(iter_ndjson(io.BytesIO(b"9" * (MAX_ELEMENT_BYTES * 4))))
+
+
+@override_settings(
+    PARTNER_API_KEYS={"acme": "s3cret"},
+    BULK_LEADS_MAX_ROWS=5,
+    BULK_LEADS_CHUNK_SIZE=2,
+    MONGO_DB_NAME="",
+)
+class BulkLeadViewTests(TestCase):
+    url = "/api/leads/bulk/"
+
+    def post(self, body, content_type="application/json", key="s3cret"):
+        headers = {"HTTP_X_API_KEY": key} if key else {}
+        return self.client.post(self.url, body, content_type=content_type, **headers)
+
+    def test_requires_api_key(self):
+        self.assertEqual(self.post("[]", key=None).status_code, 401)
+        self.assertEqual(self.post("[]", key="wrong").status_code, 401)
+
+    def test_rejects_too_many_rows(self):
+        response = self.post(json.dumps(["09123456789"] * 6))
+        self.assertEqual(response.status_code, 413)
+
+    @override_settings(BULK_LEADS_MAX_BYTES=64)
+    def test_rejects_oversized_body(self):
+        response = self.post(json.dumps(["09123456789"] * 5))
+        self.assertEqual(response.status_code, 413)
+
+    @mock.patch("leads.views.process_lead_batch")
+    def test_reports_per_row_results_and_chunks(self, task):
+        task.delay.return_value.id = "task"
+        body = "\n".join(json.dumps(v) for v in ["09123456781", {"phone": "09123456782"}, "bad", "09123456781", "09123456783"])
+
+        response = self.post(body, content_type="application/x-ndjson")
+
+        self.assertEqual(response.status_code, 202)
+        payload = response.json()
+        self.assertEqual(payload["summary"], {"queued": 3, "invalid": 1, "duplicate": 1, "failed": 0})
+        self.assertEqual([row["status"] for row in payload["results"]], ["queued", "queued", "invalid", "duplicate", "queued"])
+        self.assertEqual(
+            [call.kwargs["phone_numbers"] for call in task.delay.call_args_list],
+            [["09123456781", "09123456782"], ["09123456783"]],
+        )
+
+    def test_all_invalid_rows_is_a_bad_request(self):
+        response = self.post(json.dumps(["bad", 1]))
+        self.assertEqual(response.status_code, 400)
+
+    @mock.patch("leads.views.process_lead_batch")
+    def test_broker_outage_is_retryable(self, task):
+        task.delay.side_effect = ConnectionError("broker down")
+
+        response = self.post(json.dumps(["09123456781", "09123456782", "bad"]))
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+        self.assertEqual(response.json()["summary"]["failed"], 2)
+
+
+@override_settings(MONGO_DB_NAME="", CRM_WEBHOOK_URL="http://127.0.0.1:9/hook")
+class ProcessLeadBatchTests(TestCase):
+    def test_only_inserted_rows_are_created_and_sent(self):
+        Lead.objects.create(phone_number="09123456781", status=Lead.Status.PROCESSED)
+
+        with mock.patch("leads.delivery.schedule_delivery"):
+            result = process_lead_batch.apply(
+                kwargs={"phone_numbers": ["09123456781", "09123456782"]}
+            ).get()
+
+        self.assertEqual(result, {"created": 1, "duplicates": 1})
+        self.assertEqual(Lead.objects.get(phone_number="09123456781").status, Lead.Status.DUPLICATE)
+        self.assertEqual(
+            list(LeadOutbox.objects.values_list("lead__phone_number", flat=True)),
+            ["09123456782"],
+        )
+
+
+class AdaptiveLimiterTests(SimpleTestCase):
+    def test_fast_successes_grow_the_limit_additively(self):
+        limiter = AdaptiveLimiter(initial_limit=4, max_limit=5, target_latency=0.05)
+        for _ in range(4):
+            self.assertTrue(limiter.try_acquire())
+            limiter.release(0.01, True)
+        self.assertAlmostEqual(limiter.limit, 5.0, delta=0.1)
+
+        for _ in range(20):
+            limiter.try_acquire()
+            limiter.release(0.01, True)
+        self.assertEqual(limiter.limit, 5)
+
+    def test_slow_or_failed_enqueues_back_off(self):
+        limiter = AdaptiveLimiter(initial_limit=10, min_limit=2, backoff=0.5, target_latency=0.05)
+        releases = [(100.0, 0.2, True), (101.0, 0.01, False), (102.0, 0.01, False)]
+        limits = []
+        for now, latency, ok in releases:
+            limiter.try_acquire()
+            with mock.patch("leads.admission.monotonic", return_value=now):
+                limiter.release(latency, ok)
+            limits.append(limiter.limit)
+        self.assertEqual(limits, [5, 2.5, 2])
+
+    def test_rejects_over_the_limit(self):
+        limiter = AdaptiveLimiter(initial_limit=2)
+        self.assertTrue(limiter.try_acquire())
+        self.assertTrue(limiter.try_acquire())
+        self.assertFalse(limiter.try_acquire())
+        self.assertEqual(limiter.snapshot()["rejected"], 1)
+
+    def test_concurrent_slow_releases_back_off_once(self):
+        limiter = AdaptiveLimiter(initial_limit=32, backoff=0.9, target_latency=0.05)
+        for _ in range(32):
+            self.assertTrue(limiter.try_acquire())
+        # All 32 calls started together and hit the same latency spike.
+        for _ in range(32):
+            limiter.release(1.0, True)
+        self.assertAlmostEqual(limiter.limit, 32 * 0.9)
+
+        # A call that started after the decrease may back off again.
+        limiter.try_acquire()
+        limiter.release(0.0, False)
+        self.assertAlmostEqual(limiter.limit, 32 * 0.9 * 0.9)
+
+    def test_broker_backlog_reads_cached_sample(self):
+        limiter = AdaptiveLimiter(max_queue_depth=10, queue_sample_interval=1.0)
+        limiter.sampler = mock.Mock(latest={"queue_depth": 11, "sampled_at": time.monotonic()})
+        self.assertTrue(limiter.broker_backlogged())
+        self.assertEqual(limiter.snapshot()["queue_depth"], 11)
+
+        limiter.sampler.latest["queue_depth"] = 10
+        self.assertFalse(limiter.broker_backlogged())
+
+    def test_stale_broker_sample_is_unknown(self):
+        limiter = AdaptiveLimiter(max_queue_depth=10, queue_sample_interval=1.0)
+        limiter.sampler = mock.Mock(latest={"queue_depth": 11, "sampled_at": time.monotonic() - 60})
+        self.assertFalse(limiter.broker_backlogged())
+        self.assertIsNone(limiter.snapshot()["queue_depth"])
+
+    def test_sampler_starts_in_background_once(self):
+        limiter = AdaptiveLimiter(max_queue_depth=10)
+        with mock.patch.object(limiter, "_start_sampler", return_value=mock.Mock(latest=None)) as start:
+            self.assertFalse(limiter.broker_backlogged())
+            self.assertFalse(limiter.broker_backlogged())
+        start.assert_called_once()
+
+
+@override_settings(ADMISSION_ENABLE=True, ADMISSION_RETRY_AFTER=7, HEAVY_HITTER_ENABLE=False)
+class SubmitAdmissionTests(SimpleTestCase):
+    def submit(self):
+        return self.client.post(
+            "/api/leads/", data=json.dumps({"phone": "09123456789"}), content_type="application/json"
+        )
+
+    @mock.patch("leads.views.process_lead_submission")
+    def test_full_limiter_returns_503_with_retry_after(self, task):
+        limiter = AdaptiveLimiter(initial_limit=1)
+        limiter.try_acquire()
+        with mock.patch("leads.views.get_limiter", return_value=limiter):
+            response = self.submit()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "7")
+        task.delay.assert_not_called()
+
+    @mock.patch("leads.views.process_lead_submission")
+    def test_enqueue_releases_the_slot(self, task):
+        task.delay.return_value.id = "task-1"
+        limiter = AdaptiveLimiter(initial_limit=1)
+        with mock.patch("leads.views.get_limiter", return_value=limiter):
+            response = self.submit()
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(limiter.inflight, 0)
+
+
+@override_settings(TRAFFIC_CAPTURE_SALT="salt", HEAVY_HITTER_PHONE_PREFIX_LENGTH=7)
+class TrafficAnonymisationTests(SimpleTestCase):
+    def test_keeps_heavy_hitter_prefix_and_format(self):
+        anonymised = anonymise_phone("09123456789")
+        self.assertEqual(anonymised[:7], "0912345")
+        self.assertNotEqual(anonymised, "09123456789")
+        self.assertTrue(PHONE_PATTERN.match(anonymised))
+        self.assertEqual(anonymise_phone("09123456789"), anonymised)
+
+    def test_invalid_numbers_are_dropped(self):
+        self.assertEqual(anonymise_phone("12345"), "")
+
+    def test_clients_keep_their_network_in_replays(self):
+        same_network = [synthetic_ip(anonymise_client(f"1.2.3.{host}")) for host in (4, 5, 6)]
+        networks = {address.rsplit(".", 1)[0] for address in same_network}
+        self.assertEqual(len(networks), 1)
+        self.assertEqual(len(set(same_network)), 3)
+        self.assertNotIn(synthetic_ip(anonymise_client("1.2.4.4")).rsplit(".", 1)[0], networks)
+
+        ipv6 = [synthetic_ip(anonymise_client(f"2001:db8:1:{n}::1")) for n in (1, 2)]
+        self.assertEqual(ipv6[0].rsplit(".", 1)[0], ipv6[1].rsplit(".", 1)[0])
+        self.assertNotIn("1.2.3.4", anonymise_client("1.2.3.4"))
+
+    def test_percentile_is_nearest_rank(self):
+        values = [1, 2, 3, 4, 5]
+        self.assertEqual(percentile(values, 50), 3)
+        self.assertEqual(percentile(values, 90), 5)
+        self.assertEqual(percentile(values, 20), 1)
+        self.assertEqual(percentile([], 50), 0.0)
+
+
+@override_settings(
+    AUTOSCALE_TARGET_LAG=10,
+    AUTOSCALE_SAMPLE_INTERVAL=2,
+    AUTOSCALE_UP_COOLDOWN=5,
+    AUTOSCALE_DOWN_COOLDOWN=60,
+    AUTOSCALE_DOWN_STEP=1,
+    AUTOSCALE_BROKER_TIMEOUT=1,
+    AUTOSCALE_DURATION_WINDOW=60,
+    AUTOSCALE_DURATION_PUBLISH_INTERVAL=5,
+)
+class QueueLagAutoscalerTests(SimpleTestCase):
+    SUBMIT = "leads.tasks.process_lead_submission"
+    BATCH = "leads.tasks.process_lead_batch"
+
+    def setUp(self):
+        cache.clear()
+        self.pool = mock.Mock(num_processes=4)
+        self.scaler = autoscale.QueueLagAutoscaler(
+            self.pool, 16, 2, worker=mock.Mock(hostname="worker-1")
+        )
+        self.scaler.sampler = mock.Mock(latest=None)
+
+    def scale_at(self, now, backlog_seconds=0.0, oldest=None, sampled_at=None):
+        self.scaler.sampler.latest = {
+            "queue_depth": 0,
+            "oldest_age": oldest,
+            "backlog_seconds": backlog_seconds,
+            "task_mix": {},
+            "sampled_at": now if sampled_at is None else sampled_at,
+        }
+        with mock.patch("high_traffic.autoscale.monotonic", return_value=now):
+            return self.scaler._maybe_scale()
+
+    def test_desired_processes(self):
+        desired = self.scaler.desired_processes
+        # Little's law: 25 s of queued work drained within 10 s needs 3 processes.
+        self.assertEqual(desired(25.0, None), 3)
+        self.assertEqual(desired(0.0, None), 2)
+        self.assertEqual(desired(1000.0, None), 16)
+        # A priority message 30 s old with 4 processes scales by 30 / 10.
+        self.assertEqual(desired(0.0, 30.0), 12)
+        self.assertEqual(desired(25.0, 5.0), 3)
+
+    def test_sample_weights_backlog_by_task_mix(self):
+        autoscale.publish_task_durations({self.BATCH: [10.0, 2], self.SUBMIT: [0.5, 5]})
+
+        def message(task, age):
+            return json.dumps({"headers": {"task": task, "enqueued_at": time.time() - age}})
+
+        lists = {
+            "leads": [message(self.BATCH, 3), message(self.SUBMIT, 4)],
+            "leads_low": [message(self.SUBMIT, 100)],
+        }
+        channel = mock.Mock()
+        channel.queue_declare.side_effect = lambda queue, passive: mock.Mock(
+            message_count=len(lists[queue]) * 100
+        )
+        channel.client.lrange.side_effect = lambda queue, start, end: lists[queue][start:]
+        sampler = autoscale.BrokerSampler(
+            None,
+            queues=["leads", "leads_low"],
+            age_queues=["leads"],
+            interval=1,
+            timeout=1,
+            mix_sample=50,
+            default_task=self.SUBMIT,
+            default_duration=0.2,
+        )
+
+        stats = sampler.sample(channel)
+
+        self.assertEqual(stats["queue_depth"], 300)
+        # leads: 200 messages at (5 s + 0.1 s) / 2; leads_low: 100 at 0.1 s.
+        self.assertAlmostEqual(stats["backlog_seconds"], 520.0)
+        # leads_low is older but excluded from the age boost.
+        self.assertAlmostEqual(stats["oldest_age"], 4.0, delta=0.5)
+        self.assertEqual(stats["task_mix"], {self.BATCH: 1, self.SUBMIT: 2})
+
+    def test_durations_from_concurrent_workers_are_all_counted(self):
+        autoscale.publish_task_durations({self.BATCH: [3.0, 1]})
+        autoscale.publish_task_durations({self.BATCH: [5.0, 3]})
+        self.assertAlmostEqual(autoscale.task_duration(self.BATCH, 0.2), 2.0)
+        self.assertEqual(autoscale.task_duration(self.SUBMIT, 0.2), 0.2)
+
+    def test_record_task_duration_publishes_at_intervals(self):
+        with mock.patch.object(autoscale, "_last_publish", 0.0), mock.patch.dict(
+            autoscale._pending_durations, clear=True
+        ), mock.patch("high_traffic.autoscale.monotonic", side_effect=[100.0, 101.0, 106.0]):
+            autoscale.record_task_duration(self.SUBMIT, 0.1)
+            autoscale.record_task_duration(self.SUBMIT, 0.3)
+            self.assertAlmostEqual(autoscale.task_duration(self.SUBMIT, 0.0), 0.1)
+            autoscale.record_task_duration(self.SUBMIT, 0.5)
+        self.assertAlmostEqual(autoscale.task_duration(self.SUBMIT, 0.0), 0.3)
+
+    def test_scales_up_then_holds_on_seen_sample_and_cooldown(self):
+        self.assertTrue(self.scale_at(1000.0, backlog_seconds=100.0))
+        self.pool.grow.assert_called_once_with(6)
+
+        self.pool.num_processes = 10
+        self.assertIsNone(self.scale_at(1001.0, backlog_seconds=200.0, sampled_at=1000.0))
+        self.assertFalse(self.scale_at(1002.0, backlog_seconds=200.0))
+        self.pool.grow.assert_called_once()
+        self.assertEqual(self.scaler.last_decision["desired"], 16)
+
+    def test_scales_down_one_step_after_cooldown(self):
+        self.assertTrue(self.scale_at(1000.0, backlog_seconds=100.0))
+        self.pool.num_processes = 10
+
+        self.assertFalse(self.scale_at(1030.0))
+        self.pool.shrink.assert_not_called()
+        self.assertTrue(self.scale_at(1061.0))
+        self.pool.shrink.assert_called_once_with(1)
+
+    def test_stale_or_missing_sample_falls_back_to_stock_autoscaler(self):
+        with mock.patch.object(
+            autoscale.Autoscaler, "_maybe_scale", return_value=None
+        ) as stock:
+            self.scale_at(1000.0, backlog_seconds=100.0, sampled_at=990.0)
+            self.scaler.sampler.latest = None
+            self.scaler._maybe_scale()
+        self.assertEqual(stock.call_count, 2)
+        self.pool.grow.assert_not_called()
+
+
+class _WebhookStub(BaseHTTPRequestHandler):
+    """Local CRM stand-in that records requests and replays queued statuses."""
+
+    protocol_version = "HTTP/1.1"
+    received = []
+    statuses = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        type(self).received.append((self.headers["Idempotency-Key"], body))
+        status = type(self).statuses.pop(0) if type(self).statuses else 200
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class OutboxDeliveryTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _WebhookStub)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/hook"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        _WebhookStub.received = []
+        _WebhookStub.statuses = []
+        delivery.get_http_pool.cache_clear()
+        overrides = override_settings(
+            CRM_WEBHOOK_URL=self.url,
+            CRM_WEBHOOK_BATCH_SIZE=2,
+            CRM_WEBHOOK_CONCURRENCY=2,
+            CRM_WEBHOOK_MAX_ATTEMPTS=3,
+            CRM_WEBHOOK_RETRY_BACKOFF=5,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def add_entries(self, count, **fields):
+        return [
+            LeadOutbox.objects.create(
+                lead=Lead.objects.create(phone_number=f"0912345678{index}"),
+                **fields,
+            )
+            for index in range(count)
+        ]
+
+    def make_due(self):
+        LeadOutbox.objects.exclude(status=LeadOutbox.Status.DELIVERED).update(
+            next_attempt_at=timezone.now() - timedelta(seconds=1)
+        )
+
+    def test_delivers_in_batches_with_idempotency_key(self):
+        self.add_entries(5)
+
+        summary = {"batches": 0, "delivered": 0, "failed": 0}
+        while True:
+            result = delivery.deliver_pending()
+            if not result["batches"]:
+                break
+            for key, value in result.items():
+                summary[key] += value
+
+        self.assertEqual(summary, {"batches": 3, "delivered": 5, "failed": 0})
+        self.assertEqual(sorted(len(body["leads"]) for _, body in _WebhookStub.received), [1, 2, 2])
+        for key, body in _WebhookStub.received:
+            self.assertEqual(key, body["idempotency_key"])
+        self.assertFalse(LeadOutbox.objects.exclude(status=LeadOutbox.Status.DELIVERED).exists())
+
+    def test_retry_reuses_idempotency_key_after_backoff(self):
+        self.add_entries(2)
+        _WebhookStub.statuses = [503]
+
+        before = timezone.now()
+        self.assertEqual(delivery.deliver_pending()["failed"], 2)
+        for entry in LeadOutbox.objects.all():
+            self.assertEqual((entry.status, entry.attempts), (LeadOutbox.Status.PENDING, 1))
+            self.assertGreaterEqual(entry.next_attempt_at, before + timedelta(seconds=5))
+        # Not due yet, so nothing is resent before the backoff elapses.
+        self.assertEqual(delivery.deliver_pending()["batches"], 0)
+
+        self.make_due()
+        self.assertEqual(delivery.deliver_pending()["delivered"], 2)
+        first_key, second_key = (key for key, _ in _WebhookStub.received)
+        self.assertEqual(first_key, second_key)
+
+    def test_marks_failed_after_max_attempts(self):
+        self.add_entries(1)
+        _WebhookStub.statuses = [500, 500, 500]
+
+        backoffs = []
+        for _ in range(3):
+            self.make_due()
+            started = timezone.now()
+            delivery.deliver_pending()
+            entry = LeadOutbox.objects.get()
+            backoffs.append(round((entry.next_attempt_at - started).total_seconds()))
+
+        self.assertEqual(entry.status, LeadOutbox.Status.FAILED)
+        self.assertEqual(entry.attempts, 3)
+        self.assertIn("HTTP 500", entry.last_error)
+        self.assertEqual(backoffs, [5, 10, 20])
+        self.make_due()
+        self.assertEqual(delivery.deliver_pending()["batches"], 0)
+
+    def test_expired_lease_is_reclaimed_with_original_key(self):
+        batch_key = uuid.uuid4()
+        expired, leased = self.add_entries(2, status=LeadOutbox.Status.IN_FLIGHT)
+        LeadOutbox.objects.filter(pk=expired.pk).update(
+            batch_key=batch_key, next_attempt_at=timezone.now() - timedelta(seconds=1)
+        )
+        LeadOutbox.objects.filter(pk=leased.pk).update(
+            batch_key=uuid.uuid4(), next_attempt_at=timezone.now() + timedelta(minutes=1)
+        )
+
+        self.assertEqual(delivery.deliver_pending()["delivered"], 1)
+
+        self.assertEqual([key for key, _ in _WebhookStub.received], [str(batch_key)])
+        self.assertEqual(LeadOutbox.objects.get(pk=leased.pk).status, LeadOutbox.Status.IN_FLIGHT)
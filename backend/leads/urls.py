@@ -1,9 +1,17 @@
 from django.urls import path
 
-from .views import LandingPageView, SubmitLeadView, health_check
+from .views import (
+    BulkLeadView,
+    LandingPageView,
+    SubmitLeadView,
+    health_check,
+    heavy_hitters,
+)
 
 urlpatterns = [
     path("", LandingPageView.as_view(), name="landing"),
     path("api/leads/", SubmitLeadView.as_view(), name="submit_lead"),
+    path("api/leads/bulk/", BulkLeadView.as_view(), name="bulk_leads"),
     path("api/health/", health_check, name="health_check"),
+    path("api/heavy-hitters/", heavy_hitters, name="heavy_hitters"),
 ]
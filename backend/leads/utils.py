@@ -1,7 +1,10 @@
 from __future__ import annotations
 
+import hmac
 from typing import Optional
 
+from django.conf import settings
+
 
 def get_client_ip(request) -> Optional[str]:
     """Best-effort client IP extraction supporting proxies."""
@@ -14,3 +17,19 @@ def get_client_ip(request) -> Optional[str]:
     else:
         ip = request.META.get("REMOTE_ADDR")
     return ip
+
+
+def get_partner_name(request) -> Optional[str]:
+    """Return the partner owning the request's API key, or ``None`` if unauthenticated."""
+    header = request.META.get("HTTP_AUTHORIZATION", "")
+    if header.lower().startswith("bearer "):
+        supplied = header[7:].strip()
+    else:
+        supplied = request.META.get("HTTP_X_API_KEY", "").strip()
+    if not supplied:
+        return None
+
+    for name, key in getattr(settings, "PARTNER_API_KEYS", {}).items():
+        if hmac.compare_digest(supplied.encode("utf-8"), key.encode("utf-8")):
+            return name
+    return None
@@ -3,10 +3,12 @@ from __future__ import annotations
 import json
 import logging
 from pathlib import Path
+from time import monotonic
 from typing import Any, Dict
 
 from celery import current_app as celery_app
 from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db import connection
@@ -34,9 +36,19 @@ def ratelimit(*args, **kwargs):
 
     return _decorator
 
+from .admission import get_limiter
+from .bulk import (
+    NDJSON_CONTENT_TYPES,
+    BulkLimitError,
+    BulkParseError,
+    iter_json_array,
+    iter_ndjson,
+    validate_rows,
+)
+from .heavy_hitters import detect_hot_keys, get_detector
 from .logging import get_mongo_client
-from .tasks import process_lead_submission
-from .utils import get_client_ip
+from .tasks import process_lead_batch, process_lead_submission
+from .utils import get_client_ip, get_partner_name
 from .validators import validate_phone_number
 
 logger = logging.getLogger(__name__)
@@ -90,15 +102,46 @@ class SubmitLeadView(View):
 
         metadata = self._build_metadata(request)
 
-        try:
-            async_result = process_lead_submission.delay(
-                phone_number=phone_number,
-                metadata=metadata,
+        hot_keys = detect_hot_keys(phone_number, metadata)
+        if hot_keys:
+            metadata["heavy_hitter"] = hot_keys
+            if settings.HEAVY_HITTER_ACTION == "reject":
+                logger.info("Shedding submission from hot keys %s", hot_keys)
+                return JsonResponse(
+                    {"error": "Too many requests. Please try again later."},
+                    status=429,
+                )
+
+        limiter = get_limiter() if settings.ADMISSION_ENABLE else None
+        if limiter and (limiter.broker_backlogged() or not limiter.try_acquire()):
+            response = JsonResponse(
+                {"error": "Service is busy. Please try again shortly."},
+                status=503,
             )
+            response["Retry-After"] = str(settings.ADMISSION_RETRY_AFTER)
+            return response
+
+        started = monotonic()
+        enqueued = False
+        try:
+            if hot_keys:
+                async_result = process_lead_submission.apply_async(
+                    kwargs={"phone_number": phone_number, "metadata": metadata},
+                    queue=settings.HEAVY_HITTER_LOW_PRIORITY_QUEUE,
+                )
+            else:
+                async_result = process_lead_submission.delay(
+                    phone_number=phone_number,
+                    metadata=metadata,
+                )
             task_id = async_result.id
+            enqueued = True
         except Exception as exc:  # Broker unavailable or enqueue failure
             logger.warning("Failed to enqueue Celery task: %s", exc)
             task_id = None
+        finally:
+            if limiter:
+                limiter.release(monotonic() - started, enqueued)
 
         return JsonResponse(
             {
@@ -118,6 +161,115 @@ class SubmitLeadView(View):
         }
 
 
+@method_decorator(csrf_exempt, name="dispatch")
+class BulkLeadView(View):
+    """Accept NDJSON or JSON-array lead batches from authenticated partners."""
+
+    def post(self, request, *args, **kwargs) -> JsonResponse:
+        partner = get_partner_name(request)
+        if partner is None:
+            return JsonResponse({"error": "Invalid or missing API key."}, status=401)
+
+        # Streaming the body bypasses DATA_UPLOAD_MAX_MEMORY_SIZE, so cap it here.
+        try:
+            content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            content_length = 0
+        if content_length > settings.BULK_LEADS_MAX_BYTES:
+            return JsonResponse(
+                {"error": f"Payload too large; the limit is {settings.BULK_LEADS_MAX_BYTES} bytes."},
+                status=413,
+            )
+
+        if request.content_type in NDJSON_CONTENT_TYPES:
+            rows = iter_ndjson(request)
+        else:
+            rows = iter_json_array(request)
+
+        try:
+            results, phone_numbers = validate_rows(
+                rows,
+                max_rows=settings.BULK_LEADS_MAX_ROWS,
+            )
+        except BulkLimitError as exc:
+            return JsonResponse({"error": str(exc)}, status=413)
+        except BulkParseError as exc:
+            return JsonResponse({"error": str(exc)}, status=400)
+
+        metadata = {
+            "ip": get_client_ip(request),
+            "user_agent": request.META.get("HTTP_USER_AGENT", ""),
+            "path": request.path,
+            "method": request.method,
+            "partner": partner,
+        }
+
+        task_ids = []
+        failed: set[str] = set()
+        chunk_size = settings.BULK_LEADS_CHUNK_SIZE
+        for start in range(0, len(phone_numbers), chunk_size):
+            chunk = phone_numbers[start:start + chunk_size]
+            try:
+                async_result = process_lead_batch.delay(
+                    phone_numbers=chunk,
+                    metadata=metadata,
+                )
+                task_ids.append(async_result.id)
+            except Exception as exc:  # Broker unavailable or enqueue failure
+                logger.warning("Failed to enqueue Celery batch task: %s", exc)
+                failed.update(chunk)
+
+        summary = {"queued": 0, "invalid": 0, "duplicate": 0, "failed": 0}
+        for row in results:
+            if row["status"] == "queued" and row["phone"] in failed:
+                row.update(status="failed", error="Could not enqueue; please retry.")
+            summary[row["status"]] += 1
+
+        if summary["queued"]:
+            status = 202
+        elif summary["failed"]:
+            status = 503
+        else:
+            status = 400
+
+        response = JsonResponse(
+            {
+                "success": summary["queued"] > 0,
+                "total": len(results),
+                "summary": summary,
+                "task_ids": task_ids,
+                "results": results,
+            },
+            status=status,
+        )
+        if status == 503:
+            response["Retry-After"] = str(settings.BULK_LEADS_RETRY_AFTER)
+        return response
+
+
+@require_GET
+@staff_member_required
+def heavy_hitters(request):
+    """List the current top offenders per tracked dimension."""
+    try:
+        limit = int(request.GET.get("limit", "20"))
+    except ValueError:
+        return JsonResponse({"error": "limit must be an integer."}, status=400)
+
+    detector = get_detector()
+    return JsonResponse(
+        {
+            "enabled": settings.HEAVY_HITTER_ENABLE,
+            "action": settings.HEAVY_HITTER_ACTION,
+            "window_seconds": detector.window_seconds,
+            "thresholds": detector.thresholds,
+            "merged": detector.redis is not None,
+            "offenders": detector.top_offenders(max(1, min(limit, detector.top_k))),
+            "timestamp": timezone.now().isoformat(),
+        }
+    )
+
+
 @require_GET
 def health_check(request):
     """Composite health check for infra dependencies."""
@@ -164,6 +316,7 @@ def health_check(request):
     payload = {
         "status": "healthy" if overall_ok else "degraded",
         **status,
+        "admission": get_limiter().snapshot() if settings.ADMISSION_ENABLE else None,
         "timestamp": timezone.now().isoformat(),
     }
     return JsonResponse(payload, status=200 if overall_ok else 503)